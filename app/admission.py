@@ -0,0 +1,252 @@
+"""
+Admission control: concurrency limiting, load shedding and per-client rate limits
+
+Every request (except health, metrics and docs) takes one of
+ADMISSION_MAX_CONCURRENCY slots for its whole duration. Requests are
+classified by method and path:
+
+- critical: check-in / check-out scans. May use every slot;
+  ADMISSION_CHECK_IN_RESERVED of them are theirs alone.
+- normal: everything else (member lookups, writes, ...).
+- low: admin listings, searches over history, stats and exports. Limited
+  to ADMISSION_LOW_SHARE of the slots and shed first.
+
+A request that finds its class at its ceiling waits up to its class's queue
+timeout (critical longest, low not at all by default) and is then shed with
+503 and Retry-After. Freed slots go to waiting critical requests first.
+
+With ADMISSION_CLIENT_RATE > 0 each client (ADMISSION_CLIENT_HEADER, e.g. a
+gateway id, or else the peer address) also gets a token bucket of that many
+requests per second with ADMISSION_CLIENT_BURST burst; requests beyond it
+get 429 with the time until the next token in Retry-After.
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from app.cache import TTLCache
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_CONTROL", "1").lower() in ("1", "true", "yes")
+MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "100"))
+CHECK_IN_RESERVED = int(os.getenv("ADMISSION_CHECK_IN_RESERVED", "20"))
+LOW_SHARE = float(os.getenv("ADMISSION_LOW_SHARE", "0.5"))
+QUEUE_TIMEOUTS = {
+    "critical": float(os.getenv("ADMISSION_CRITICAL_QUEUE_TIMEOUT", "2.0")),
+    "normal": float(os.getenv("ADMISSION_NORMAL_QUEUE_TIMEOUT", "0.5")),
+    "low": float(os.getenv("ADMISSION_LOW_QUEUE_TIMEOUT", "0")),
+}
+RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))
+CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "40"))
+CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "").lower()
+
+PRIORITIES = ("critical", "normal", "low")
+
+EXEMPT_PATHS = {"/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
+# (method, path pattern) -> class; anything unmatched is normal
+CLASSES = [
+    ("POST", re.compile(r"^/attendance/(check-in(/bulk)?|check-out)$"), "critical"),
+    ("GET", re.compile(r"^/(members|subscriptions)/?$"), "low"),
+    ("GET", re.compile(r"^/attendance/members/[^/]+/attendance$"), "low"),
+    ("GET", re.compile(r"^/attendance/stats/"), "low"),
+    ("GET", re.compile(r"^/exports/"), "low"),
+    ("POST", re.compile(r"^/members/import$"), "low"),
+]
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Priority class of a request, or None when it bypasses admission control"""
+    if path in EXEMPT_PATHS:
+        return None
+    for class_method, pattern, priority in CLASSES:
+        if method == class_method and pattern.match(path):
+            return priority
+    return "normal"
+
+
+class ConcurrencyLimiter:
+    """
+    Slots shared by priority classes, each allowed to start requests only
+    while fewer than its ceiling are running. Waiters are served strictly
+    by class, then in arrival order.
+    """
+
+    def __init__(self, ceilings: Dict[str, int]):
+        self.ceilings = ceilings
+        self.active = 0
+        self._waiters = {priority: deque() for priority in PRIORITIES}
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _has_priority_waiters(self, priority: str) -> bool:
+        for waiting in PRIORITIES[:PRIORITIES.index(priority) + 1]:
+            if self._waiters[waiting]:
+                return True
+        return False
+
+    async def acquire(self, priority: str, timeout: float) -> bool:
+        """Take a slot, waiting up to `timeout` seconds; False when shed"""
+        if self.active < self.ceilings[priority] and not self._has_priority_waiters(priority):
+            self.active += 1
+            return True
+        if timeout <= 0:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Granted just as the wait timed out
+                return True
+            future.cancel()
+            return False
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            future.cancel()
+            raise
+        finally:
+            if future in self._waiters[priority]:
+                self._waiters[priority].remove(future)
+
+    def release(self):
+        self.active -= 1
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while waiters and self.active < self.ceilings[priority]:
+                future = waiters.popleft()
+                if not future.done():
+                    self.active += 1
+                    future.set_result(None)
+            if waiters:
+                # Lower classes never jump a waiting higher class
+                return
+
+
+class TokenBuckets:
+    """Per-client token buckets, kept for recently seen clients only"""
+
+    def __init__(self, rate: float, burst: float, maxsize: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        # Idle clients refill completely within burst / rate seconds
+        self._buckets = TTLCache(maxsize, ttl=max(burst / rate, 1.0) if rate > 0 else 1.0)
+
+    def take(self, client: str) -> float:
+        """Spend a token; returns 0 when allowed, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(client) or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets.set(client, (tokens, now))
+            return (1 - tokens) / self.rate
+        self._buckets.set(client, (tokens - 1, now))
+        return 0.0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int, check_in_reserved: int, low_share: float,
+                 queue_timeouts: Dict[str, float], client_rate: float, client_burst: float):
+        normal = max(max_concurrency - check_in_reserved, 1)
+        self.limiter = ConcurrencyLimiter({
+            "critical": max_concurrency,
+            "normal": normal,
+            "low": max(min(int(max_concurrency * low_share), normal), 1),
+        })
+        self.queue_timeouts = queue_timeouts
+        self.buckets = TokenBuckets(client_rate, client_burst) if client_rate > 0 else None
+        self.admitted = dict.fromkeys(PRIORITIES, 0)
+        self.shed = dict.fromkeys(PRIORITIES, 0)
+        self.rate_limited = 0
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        stats = {
+            "active": self.limiter.active,
+            "queued": self.limiter.queued,
+            "rate_limited": self.rate_limited,
+            "tracked_clients": len(self.buckets) if self.buckets is not None else 0,
+        }
+        for priority in PRIORITIES:
+            stats[f"{priority}_ceiling"] = self.limiter.ceilings[priority]
+            stats[f"{priority}_admitted"] = self.admitted[priority]
+            stats[f"{priority}_shed"] = self.shed[priority]
+        return stats
+
+
+admission_controller = AdmissionController(
+    MAX_CONCURRENCY, CHECK_IN_RESERVED, LOW_SHARE, QUEUE_TIMEOUTS, CLIENT_RATE, CLIENT_BURST
+)
+
+
+def _client_id(scope) -> str:
+    if CLIENT_HEADER:
+        for name, value in scope.get("headers", []):
+            if name.decode("latin-1") == CLIENT_HEADER:
+                return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, status: int, detail: str, retry_after: int):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying `controller` to every HTTP request"""
+
+    def __init__(self, app, controller: AdmissionController = admission_controller, retry_after: int = RETRY_AFTER):
+        self.app = app
+        self.controller = controller
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        priority = classify(scope["method"], scope["path"])
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller
+        if controller.buckets is not None:
+            wait = controller.buckets.take(_client_id(scope))
+            if wait:
+                controller.rate_limited += 1
+                await _reject(send, 429, "Too many requests from this client", math.ceil(wait))
+                return
+
+        if not await controller.limiter.acquire(priority, controller.queue_timeouts[priority]):
+            controller.shed[priority] += 1
+            await _reject(send, 503, "Server busy, retry shortly", self.retry_after)
+            return
+        controller.admitted[priority] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.limiter.release()
@@ -0,0 +1,223 @@
+"""
+Attendance archival into monthly storage
+
+Check-ins older than the hot horizon (ATTENDANCE_HOT_MONTHS whole months
+before the current one) are moved out of `attendance` so its indexes stay
+small. On PostgreSQL they go to `attendance_archive`, a table partitioned
+by range on check_in_time with one partition per month; on SQLite each
+month gets its own `attendance_archive_YYYY_MM` table. Archived months are
+recorded in `attendance_archive_months`.
+
+Rows keep their ids, so history pages can merge hot and archived rows on
+the same (check_in_time, id) keyset. Readers only consult the archive when
+the requested range reaches below the hot cutoff.
+
+archive_attendance() runs in batches, each copying and deleting its rows in
+one transaction, so an interrupted run simply resumes on the next call:
+
+    python -m app.archive [--batch-size N]
+
+Readers derive the hot cutoff from ATTENDANCE_HOT_MONTHS too, so the job
+and the API must run with the same setting.
+"""
+import argparse
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, MetaData, PrimaryKeyConstraint, String, Table,
+    delete, insert, select, text, union_all
+)
+
+from app.models import Attendance, AttendanceArchiveMonth, add_missing_columns
+
+logger = logging.getLogger(__name__)
+
+HOT_MONTHS = int(os.getenv("ATTENDANCE_HOT_MONTHS", "6"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ATTENDANCE_ARCHIVE_BATCH_SIZE", "5000"))
+
+PARENT_NAME = "attendance_archive"
+
+# Archive tables are created on demand, not by Base.metadata.create_all()
+archive_metadata = MetaData()
+
+_tables = {}
+
+
+def month_start(moment) -> date:
+    return date(moment.year, moment.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def hot_cutoff(now: Optional[datetime] = None) -> datetime:
+    """Check-ins before this instant are eligible for the archive; later ones are always hot"""
+    month = add_months(month_start(now or datetime.utcnow()), -HOT_MONTHS)
+    return datetime(month.year, month.month, 1)
+
+
+def _columns():
+    return [
+        Column("id", Integer, nullable=False),
+        Column("member_id", Integer, nullable=False),
+        Column("check_in_time", DateTime, nullable=False),
+        Column("check_out_time", DateTime, nullable=True),
+        Column("notes", String(500), nullable=True),
+        Column("created_at", DateTime),
+        Column("plan_id", Integer, nullable=True),
+    ]
+
+
+def _table(name: str, *constraints, **kwargs) -> Table:
+    if name not in _tables:
+        table = Table(name, archive_metadata, *_columns(), *constraints, **kwargs)
+        Index(f"ix_{name}_member_check_in", table.c.member_id, table.c.check_in_time)
+        # Incremental exports (app.export)
+        Index(f"ix_{name}_created", table.c.created_at, table.c.id)
+        _tables[name] = table
+    return _tables[name]
+
+
+def parent_table() -> Table:
+    """PostgreSQL: the partitioned archive table (the primary key must include the partition key)"""
+    return _table(
+        PARENT_NAME,
+        PrimaryKeyConstraint("id", "check_in_time"),
+        postgresql_partition_by="RANGE (check_in_time)",
+    )
+
+
+def month_table(month: date) -> Table:
+    """SQLite: the archive table of one month"""
+    return _table(f"{PARENT_NAME}_{month.year}_{month.month:02d}", PrimaryKeyConstraint("id"))
+
+
+def _ensure_month(connection, month: date) -> Table:
+    """Create the month's partition / table if needed; return the table to insert into"""
+    if connection.dialect.name == "postgresql":
+        parent = parent_table()
+        parent.create(connection, checkfirst=True)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {PARENT_NAME}_{month.year}_{month.month:02d} "
+            f"PARTITION OF {PARENT_NAME} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        return parent
+    table = month_table(month)
+    table.create(connection, checkfirst=True)
+    return table
+
+
+def archive_source(dialect: str, months: List[date]):
+    """
+    A selectable with the attendance columns covering the given archived
+    months, or None when there are none
+    """
+    if not months:
+        return None
+    if dialect == "postgresql":
+        # Partition pruning on the caller's check_in_time range does the rest
+        return parent_table()
+    tables = [month_table(month) for month in sorted(months, reverse=True)]
+    if len(tables) == 1:
+        return tables[0]
+    return union_all(*(select(*table.c) for table in tables)).subquery(PARENT_NAME)
+
+
+async def archived_months(db, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[date]:
+    """Archived months overlapping [since, until)"""
+    query = select(AttendanceArchiveMonth.month)
+    if since is not None:
+        query = query.where(AttendanceArchiveMonth.month >= month_start(since))
+    if until is not None:
+        query = query.where(AttendanceArchiveMonth.month <= until.date())
+    return list((await db.scalars(query)).all())
+
+
+def all_archive_sources(connection) -> list:
+    """Every archive table holding rows (sync connection), for maintenance jobs"""
+    months = connection.scalars(select(AttendanceArchiveMonth.month)).all()
+    if not months:
+        return []
+    if connection.dialect.name == "postgresql":
+        return [parent_table()]
+    return [month_table(month) for month in months]
+
+
+def install_archive_columns(connection):
+    """Add attendance columns introduced since existing archive tables were created"""
+    for table in all_archive_sources(connection):
+        add_missing_columns(connection, table)
+
+
+def _record_months(connection, counts: dict):
+    """Add archived row counts to the catalog, creating month entries as needed"""
+    now = datetime.utcnow()
+    existing = {
+        row.month: row for row in connection.execute(
+            select(AttendanceArchiveMonth.month, AttendanceArchiveMonth.row_count)
+            .where(AttendanceArchiveMonth.month.in_(list(counts)))
+        )
+    }
+    for month, count in counts.items():
+        if month in existing:
+            connection.execute(
+                AttendanceArchiveMonth.__table__.update()
+                .where(AttendanceArchiveMonth.month == month)
+                .values(row_count=existing[month].row_count + count, archived_at=now)
+            )
+        else:
+            connection.execute(insert(AttendanceArchiveMonth).values(month=month, row_count=count, archived_at=now))
+
+
+def archive_attendance(engine, cutoff: Optional[datetime] = None, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move check-ins before `cutoff` (default: hot_cutoff()) into the archive,
+    oldest first, one transaction per batch. Returns the rows moved.
+    """
+    cutoff = cutoff or hot_cutoff()
+    columns = list(Attendance.__table__.c)
+    moved = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(*columns)
+                .where(Attendance.check_in_time < cutoff)
+                .order_by(Attendance.check_in_time)
+                .limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+
+            by_month = defaultdict(list)
+            for row in rows:
+                by_month[month_start(row["check_in_time"])].append(dict(row))
+            for month, month_rows in by_month.items():
+                connection.execute(insert(_ensure_month(connection, month)), month_rows)
+            _record_months(connection, {month: len(month_rows) for month, month_rows in by_month.items()})
+            connection.execute(delete(Attendance).where(Attendance.id.in_([row["id"] for row in rows])))
+        moved += len(rows)
+        logger.info("Archived %d check-ins (%d so far)", len(rows), moved)
+    return moved
+
+
+def main():
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Move old check-ins from attendance into monthly archive storage")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Rows per transaction")
+    args = parser.parse_args()
+
+    cutoff = hot_cutoff()
+    moved = archive_attendance(engine, cutoff, args.batch_size)
+    print(f"Archived {moved} check-ins from before {cutoff.date()}")
+
+
+if __name__ == "__main__":
+    main()
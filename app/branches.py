@@ -0,0 +1,59 @@
+"""
+Per-request branch selection for multi-branch deployments
+
+Requests name their branch in the X-Branch-Id header (BRANCH_HEADER);
+sessions from get_db / get_read_db then use that branch's shard (see
+BRANCH_SHARDS in app.database). Requests without the header go to
+DEFAULT_BRANCH; an unknown branch gets 404 before any handler runs.
+"""
+import json
+import os
+
+from app.database import SHARD_MAP, current_branch
+
+BRANCH_HEADER = os.getenv("BRANCH_HEADER", "X-Branch-Id").lower().encode("latin-1")
+
+
+def _branch(scope):
+    for name, value in scope.get("headers", []):
+        if name == BRANCH_HEADER:
+            return value.decode("latin-1").strip()
+    return None
+
+
+async def _unknown_branch(send):
+    body = json.dumps({"detail": "Unknown branch"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 404,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class BranchMiddleware:
+    """Pure ASGI middleware setting current_branch from the request header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        branch = _branch(scope)
+        if branch is None:
+            await self.app(scope, receive, send)
+            return
+        if branch not in SHARD_MAP:
+            await _unknown_branch(send)
+            return
+
+        token = current_branch.set(branch)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_branch.reset(token)
@@ -0,0 +1,175 @@
+"""
+In-process caches shared by the routers
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+from sqlalchemy import select
+
+from app.database import current_branch, open_session
+from app.models import Plan
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after `ttl` seconds.
+
+    Keeps hit/miss counters so the cache can be monitored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or `default` when missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class PlanCatalog:
+    """
+    In-memory copy of the plans table (one per branch).
+
+    Plans change rarely, so the whole table is loaded at once and kept until
+    a plan write invalidates it (or `ttl` passes, which bounds staleness
+    across processes; lookups of ids missing from the catalog always ask
+    the database). Cached Plan objects are detached; merge them into a
+    session with `load=False` to use them in relationships without a SELECT.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # branch -> (plans by id, etag, expiry); every branch shard has its own plans
+        self._catalogs: Dict[str, tuple] = {}
+        self._lock = asyncio.Lock()
+
+    def _fresh(self, branch: str) -> Optional[tuple]:
+        catalog = self._catalogs.get(branch)
+        if catalog is not None and catalog[2] > time.monotonic():
+            self.hits += 1
+            return catalog
+        return None
+
+    async def _catalog(self) -> tuple:
+        branch = current_branch.get()
+        catalog = self._fresh(branch)
+        if catalog is not None:
+            return catalog
+        async with self._lock:
+            catalog = self._fresh(branch)
+            if catalog is not None:
+                return catalog
+            self.misses += 1
+            db = open_session()
+            try:
+                plans = (await db.scalars(select(Plan).order_by(Plan.id))).all()
+            finally:
+                await db.close()
+            fingerprint = "|".join(f"{plan.id}:{plan.updated_at.isoformat()}" for plan in plans)
+            etag = '"' + hashlib.sha1(fingerprint.encode()).hexdigest() + '"'
+            catalog = ({plan.id: plan for plan in plans}, etag, time.monotonic() + self.ttl)
+            self._catalogs[branch] = catalog
+            return catalog
+
+    async def all(self) -> List[Plan]:
+        """Every plan, ordered by id"""
+        plans, _, _ = await self._catalog()
+        return list(plans.values())
+
+    async def get(self, plan_id: int) -> Optional[Plan]:
+        """
+        The plan, or None. A miss is checked against the database, and the
+        catalog reloaded if another process created the plan meanwhile.
+        """
+        plans, _, _ = await self._catalog()
+        plan = plans.get(plan_id)
+        if plan is None and await self._exists(plan_id):
+            self.invalidate()
+            plans, _, _ = await self._catalog()
+            plan = plans.get(plan_id)
+        return plan
+
+    async def _exists(self, plan_id: int) -> bool:
+        db = open_session()
+        try:
+            return await db.scalar(select(Plan.id).where(Plan.id == plan_id)) is not None
+        finally:
+            await db.close()
+
+    async def etag(self) -> str:
+        """Strong validator that changes whenever any plan changes"""
+        _, etag, _ = await self._catalog()
+        return etag
+
+    def invalidate(self) -> None:
+        self._catalogs.pop(current_branch.get(), None)
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {
+            "size": sum(len(plans) for plans, _, _ in self._catalogs.values()),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# (branch, member_id) -> tuple of (start_date, end_date, plan_id) windows of active
+# subscriptions; members without one are not cached, so check-in re-reads them
+subscription_windows = TTLCache(
+    maxsize=int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "100000")),
+    ttl=float(os.getenv("SUBSCRIPTION_CACHE_TTL", "30")),
+)
+
+plan_catalog = PlanCatalog(ttl=float(os.getenv("PLAN_CACHE_TTL", "300")))
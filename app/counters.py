@@ -0,0 +1,162 @@
+"""
+Maintenance of the Member.total_check_ins counter
+
+The counter is kept by a database trigger on attendance inserts, installed
+at startup for the active dialect. reconcile_check_in_counts() recomputes it
+from the attendance table in batches in case it ever drifts.
+
+Run the reconciliation from the command line with:
+
+    python -m app.counters [--batch-size N]
+"""
+import argparse
+import logging
+
+from sqlalchemy import and_, exists, func, select, text, union_all, update
+
+from app.archive import all_archive_sources
+from app.models import Attendance, Member, postgres_trigger_current
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_NAME = "attendance_insert_trigger"
+
+POSTGRES_FUNCTION_BODY = """
+        BEGIN
+            UPDATE members
+            SET total_check_ins = total_check_ins + 1
+            WHERE id = NEW.member_id;
+            RETURN NEW;
+        END;
+"""
+
+# Statements installing the trigger, per dialect; each list is idempotent
+TRIGGER_DDL = {
+    "sqlite": [
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME}",
+        f"""
+        CREATE TRIGGER {TRIGGER_NAME}
+        AFTER INSERT ON attendance
+        FOR EACH ROW
+        BEGIN
+            UPDATE members
+            SET total_check_ins = total_check_ins + 1
+            WHERE id = NEW.member_id;
+        END
+        """,
+    ],
+    "postgresql": [
+        # Older copies of triggers.sql installed a second, double-counting trigger
+        "DROP TRIGGER IF EXISTS increment_member_check_ins ON attendance",
+        "DROP FUNCTION IF EXISTS increment_member_check_ins_func()",
+        f"""
+        CREATE OR REPLACE FUNCTION increment_member_check_ins()
+        RETURNS TRIGGER AS $$
+        {POSTGRES_FUNCTION_BODY}
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON attendance",
+        f"""
+        CREATE TRIGGER {TRIGGER_NAME}
+        AFTER INSERT ON attendance
+        FOR EACH ROW
+        EXECUTE FUNCTION increment_member_check_ins()
+        """,
+    ],
+}
+
+
+def install_check_in_trigger(connection) -> bool:
+    """
+    Install the total_check_ins trigger for the connection's dialect.
+
+    Returns False (and logs a warning) for dialects without a trigger.
+    """
+    statements = TRIGGER_DDL.get(connection.dialect.name)
+    if statements is None:
+        logger.warning(
+            "No check-in counter trigger for dialect %s; run reconciliation to refresh total_check_ins",
+            connection.dialect.name,
+        )
+        return False
+
+    if connection.dialect.name == "postgresql" and postgres_trigger_current(
+        connection, TRIGGER_NAME, "attendance", POSTGRES_FUNCTION_BODY
+    ):
+        # Re-creating it would lock attendance against check-ins
+        return True
+    for statement in statements:
+        connection.execute(text(statement))
+    return True
+
+
+def reconcile_check_in_counts(engine, batch_size: int = 10000) -> int:
+    """
+    Recompute total_check_ins from attendance (hot and archived), one
+    member id range per transaction, and return the number of members
+    corrected.
+
+    Each batch is a single UPDATE ... FROM over a GROUP BY of attendance,
+    plus a reset of members in the range that have no attendance at all.
+    """
+    with engine.connect() as connection:
+        max_id = connection.scalar(select(func.max(Member.id))) or 0
+
+        # Archived check-ins still count
+        sources = [Attendance.__table__] + all_archive_sources(connection)
+
+    fixed = 0
+    for low in range(0, max_id + 1, batch_size):
+        high = low + batch_size
+        per_source = [
+            select(source.c.member_id, func.count().label("check_ins"))
+            .where(source.c.member_id >= low, source.c.member_id < high)
+            .group_by(source.c.member_id)
+            for source in sources
+        ]
+        if len(per_source) == 1:
+            counts = per_source[0].subquery()
+        else:
+            partial = union_all(*per_source).subquery()
+            counts = (
+                select(partial.c.member_id, func.sum(partial.c.check_ins).label("check_ins"))
+                .group_by(partial.c.member_id)
+                .subquery()
+            )
+        in_range = and_(Member.id >= low, Member.id < high)
+
+        with engine.begin() as connection:
+            fixed += connection.execute(
+                update(Member)
+                .where(
+                    Member.id == counts.c.member_id,
+                    Member.total_check_ins != counts.c.check_ins,
+                )
+                .values(total_check_ins=counts.c.check_ins)
+            ).rowcount
+            fixed += connection.execute(
+                update(Member)
+                .where(
+                    in_range,
+                    Member.total_check_ins != 0,
+                    *(~exists().where(source.c.member_id == Member.id) for source in sources),
+                )
+                .values(total_check_ins=0)
+            ).rowcount
+
+    return fixed
+
+
+def main():
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Recompute members.total_check_ins from attendance")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Member ids per transaction")
+    args = parser.parse_args()
+
+    fixed = reconcile_check_in_counts(engine, args.batch_size)
+    print(f"Corrected total_check_ins for {fixed} members")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
 """
 Database configuration and session management (SQLite Version)
 """
+import asyncio
+import json
 import os
-from sqlalchemy import create_engine
+import re
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Hashable, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 
 # Get SQLite DB path (default: membership.db in current folder)
 DATABASE_URL = os.getenv(
@@ -12,26 +21,503 @@ DATABASE_URL = os.getenv(
     "sqlite:///./membership.db"
 )
 
-# Create engine for SQLite
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # Important for SQLite
-    pool_pre_ping=True,
-    echo=False
+# Async driver for each sync URL scheme
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def _async_url(url: str) -> str:
+    """Derive the async driver URL from a sync DATABASE_URL"""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+# Set DB_ASYNC=0 to serve requests from the blocking engine on the threadpool
+USE_ASYNC_DB = os.getenv("DB_ASYNC", "1").lower() in ("1", "true", "yes")
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+
+# Connection pool of each engine (the read engine gets its own pool)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+
+# SQLite engine profile: "production" sets the pragmas below on every new
+# connection; "default" leaves SQLite's own settings
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative: KiB
+
+# Read-only GET handlers use DATABASE_READ_URL (e.g. a Postgres replica) when
+# set. A SQLite file gets a second, query-only pool on the same file, so
+# readers never queue behind the writer's connections; with WAL they read a
+# snapshot while check-ins commit. Otherwise reads share the primary engine.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+ASYNC_DATABASE_READ_URL = os.getenv(
+    "ASYNC_DATABASE_READ_URL", _async_url(DATABASE_READ_URL) if DATABASE_READ_URL else None
 )
 
-# Session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _is_sqlite_file(url: str) -> bool:
+    return _is_sqlite(url) and make_url(url).database not in (None, "", ":memory:")
+
+
+def _sqlite_pragmas(read_only: bool) -> list:
+    pragmas = [
+        "synchronous = NORMAL",
+        f"busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+        f"mmap_size = {SQLITE_MMAP_SIZE}",
+        f"cache_size = {SQLITE_CACHE_SIZE}",
+    ]
+    # journal_mode is stored in the database file, so only the writer sets it
+    return pragmas + ["query_only = ON"] if read_only else ["journal_mode = WAL"] + pragmas
+
+
+def _install_sqlite_profile(sync_engine, read_only: bool):
+    pragmas = _sqlite_pragmas(read_only)
+
+    @event.listens_for(sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def _engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": True, "echo": False}
+    # In-memory SQLite uses a single-connection pool without these knobs
+    if not _is_sqlite(url) or _is_sqlite_file(url):
+        options.update(
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=POOL_RECYCLE,
+        )
+    return options
+
+
+def _install_search_path(sync_engine, schema: str):
+    @event.listens_for(sync_engine, "connect")
+    def _set_search_path(dbapi_connection, connection_record):
+        autocommit = dbapi_connection.autocommit
+        dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'SET SESSION search_path TO "{schema}", public')
+        cursor.close()
+        dbapi_connection.autocommit = autocommit
+
+
+def _configure(new_engine, url: str, read_only: bool = False, schema: Optional[str] = None):
+    sync_engine = getattr(new_engine, "sync_engine", new_engine)
+    if _is_sqlite(url) and SQLITE_PROFILE == "production":
+        _install_sqlite_profile(sync_engine, read_only)
+    if schema:
+        _install_search_path(sync_engine, schema)
+    return new_engine
+
+
+def _read_url(primary: str, configured: Optional[str]) -> Optional[str]:
+    """URL of the read engine, or None to read through the primary engine"""
+    if configured:
+        return configured
+    return primary if _is_sqlite_file(primary) else None
+
+
+def _create_engine(url: str, read_only: bool = False, schema: Optional[str] = None):
+    return _configure(create_engine(
+        url,
+        connect_args={"check_same_thread": False} if _is_sqlite(url) else {},
+        **_engine_options(url)
+    ), url, read_only, schema)
+
+
+# Sessions open at once in sync mode, per engine (pool_size + max_overflow by
+# default). Waiting here instead of in a threadpool thread stops blocked
+# checkouts from starving the threads that hold connections.
+SYNC_MAX_SESSIONS = int(os.getenv("DB_SYNC_MAX_SESSIONS", str(POOL_SIZE + MAX_OVERFLOW)))
+
+
+class Shard:
+    """
+    Engines and session factories of one database: a primary engine, a read
+    engine (the primary itself unless a read URL applies) and their async
+    counterparts when DB_ASYNC is on
+    """
+
+    def __init__(self, url: str, async_url: Optional[str] = None, read_url: Optional[str] = None,
+                 async_read_url: Optional[str] = None, schema: Optional[str] = None):
+        self.url = url
+        self.schema = schema
+
+        self.engine = _create_engine(url, schema=schema)
+        sync_read_url = _read_url(url, read_url)
+        self.read_engine = self.engine
+        if sync_read_url:
+            self.read_engine = _create_engine(sync_read_url, read_only=True, schema=schema)
+
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.read_engine)
+        self.session_slots = asyncio.Semaphore(SYNC_MAX_SESSIONS)
+        self.read_slots = (
+            self.session_slots if self.read_engine is self.engine else asyncio.Semaphore(SYNC_MAX_SESSIONS)
+        )
+
+        # Async engines are only built when enabled, so the async driver
+        # stays optional for sync deployments
+        self.async_engine = None
+        self.async_read_engine = None
+        self.AsyncSessionLocal = None
+        self.AsyncReadSessionLocal = None
+        if USE_ASYNC_DB:
+            from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+            async_url = async_url or _async_url(url)
+            self.async_engine = _configure(
+                create_async_engine(async_url, **_engine_options(async_url)), async_url, schema=schema
+            )
+            self.AsyncSessionLocal = async_sessionmaker(
+                bind=self.async_engine,
+                autoflush=False,
+                expire_on_commit=False
+            )
+
+            async_read_url = _read_url(async_url, async_read_url or (_async_url(read_url) if read_url else None))
+            self.async_read_engine = self.async_engine
+            if async_read_url:
+                self.async_read_engine = _configure(
+                    create_async_engine(async_read_url, **_engine_options(async_read_url)),
+                    async_read_url,
+                    read_only=True,
+                    schema=schema
+                )
+            self.AsyncReadSessionLocal = async_sessionmaker(
+                bind=self.async_read_engine,
+                autoflush=False,
+                expire_on_commit=False
+            )
+
+    def create_schema(self):
+        """
+        Create the shard's PostgreSQL schema if missing; run before creating
+        its tables, which would otherwise land in public (next on the
+        search_path)
+        """
+        if self.schema:
+            with self.engine.begin() as connection:
+                connection.exec_driver_sql(f'CREATE SCHEMA IF NOT EXISTS "{self.schema}"')
+
+    def open_session(self):
+        if USE_ASYNC_DB:
+            return self.AsyncSessionLocal()
+        return SyncSessionAdapter(self.SessionLocal(expire_on_commit=False))
+
+    def open_read_session(self):
+        if USE_ASYNC_DB:
+            return self.AsyncReadSessionLocal()
+        return SyncSessionAdapter(self.ReadSessionLocal(expire_on_commit=False))
+
+    def sync_engines(self) -> list:
+        engines = []
+        for candidate in (self.engine, self.read_engine, self.async_engine, self.async_read_engine):
+            if candidate is not None:
+                candidate = getattr(candidate, "sync_engine", candidate)
+                if candidate not in engines:
+                    engines.append(candidate)
+        return engines
+
+    async def dispose(self):
+        if self.async_read_engine is not self.async_engine:
+            await self.async_read_engine.dispose()
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        if self.read_engine is not self.engine:
+            self.read_engine.dispose()
+        self.engine.dispose()
+
+
+# Multi-branch sharding. BRANCH_SHARDS maps branch ids to their database,
+# as inline JSON or the path of a JSON file:
+#
+#     {"north": "sqlite:///./north.db",
+#      "south": {"url": "postgresql://db/gym", "schema": "south"}}
+#
+# Entries take url plus optional async_url, read_url, async_read_url and
+# schema (a PostgreSQL schema selected with search_path). Requests pick
+# their branch with the X-Branch-Id header (app.branches); DEFAULT_BRANCH
+# serves requests without one and, unless listed, lives in DATABASE_URL.
+DEFAULT_BRANCH = os.getenv("DEFAULT_BRANCH", "main")
+
+SHARD_KEYS = {"url", "async_url", "read_url", "async_read_url", "schema"}
+_SCHEMA_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _load_shard_map(value: str) -> dict:
+    """Parse BRANCH_SHARDS into branch -> shard settings"""
+    if not value:
+        return {}
+    if value.lstrip().startswith("{"):
+        shards = json.loads(value)
+    else:
+        with open(value) as f:
+            shards = json.load(f)
+
+    settings = {}
+    for branch, entry in shards.items():
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        unknown = set(entry) - SHARD_KEYS
+        if unknown:
+            raise ValueError(f"BRANCH_SHARDS[{branch!r}]: unknown keys {sorted(unknown)}")
+        if not entry.get("url"):
+            raise ValueError(f"BRANCH_SHARDS[{branch!r}]: url is required")
+        schema = entry.get("schema")
+        if schema is not None and (_is_sqlite(entry["url"]) or not _SCHEMA_NAME.match(schema)):
+            raise ValueError(f"BRANCH_SHARDS[{branch!r}]: schema must be a plain PostgreSQL schema name")
+        settings[str(branch)] = entry
+    return settings
+
+
+_PRIMARY_SETTINGS = {
+    "url": DATABASE_URL,
+    "async_url": ASYNC_DATABASE_URL,
+    "read_url": DATABASE_READ_URL,
+    "async_read_url": ASYNC_DATABASE_READ_URL,
+}
+
+SHARD_MAP = _load_shard_map(os.getenv("BRANCH_SHARDS", ""))
+SHARDING_ENABLED = bool(SHARD_MAP)
+SHARD_MAP.setdefault(DEFAULT_BRANCH, _PRIMARY_SETTINGS)
+BRANCHES = tuple(SHARD_MAP)
+
+current_branch: ContextVar[str] = ContextVar("current_branch", default=DEFAULT_BRANCH)
+
+# Shards by their settings, so branches sharing a database share its pools
+_shards: Dict[tuple, Shard] = {}
+
+
+def _shard(settings: dict) -> Shard:
+    key = tuple(sorted((name, value) for name, value in settings.items() if value is not None))
+    if key not in _shards:
+        _shards[key] = Shard(**dict(key))
+    return _shards[key]
+
+
+def get_shard(branch: Optional[str] = None) -> Shard:
+    """The shard of `branch` (default: the current branch), built on first use"""
+    return _shard(SHARD_MAP[branch or current_branch.get()])
+
+
+def branch_shards() -> list:
+    """Every distinct shard serving a branch"""
+    shards = []
+    for branch in BRANCHES:
+        shard = get_shard(branch)
+        if shard not in shards:
+            shards.append(shard)
+    return shards
+
+
+def directory_shard() -> Shard:
+    """The DATABASE_URL database, home of cross-branch tables"""
+    return _shard(_PRIMARY_SETTINGS)
+
+
+@contextmanager
+def use_branch(branch: str):
+    """Route sessions opened inside the block to `branch`"""
+    if branch not in SHARD_MAP:
+        raise ValueError(f"Unknown branch {branch!r}")
+    token = current_branch.set(branch)
+    try:
+        yield
+    finally:
+        current_branch.reset(token)
+
+
+def branch_scoped(key: Hashable) -> tuple:
+    """Key for per-process caches of rows whose ids are only unique within a branch"""
+    return (current_branch.get(), key)
+
+
+def dialect_name() -> str:
+    """SQL dialect of the current branch's database"""
+    return get_shard().engine.dialect.name
+
+
+# Engines of the default branch, for scripts and maintenance jobs (set
+# DEFAULT_BRANCH to run those against another branch)
+_default_shard = get_shard(DEFAULT_BRANCH)
+engine = _default_shard.engine
+read_engine = _default_shard.read_engine
+async_engine = _default_shard.async_engine
+async_read_engine = _default_shard.async_read_engine
+SessionLocal = _default_shard.SessionLocal
+ReadSessionLocal = _default_shard.ReadSessionLocal
+AsyncSessionLocal = _default_shard.AsyncSessionLocal
+AsyncReadSessionLocal = _default_shard.AsyncReadSessionLocal
 
 # Base class for models
 Base = declarative_base()
 
-def get_db():
+
+class _ThreadedStream:
+    """Async iterator over a sync Result/ScalarResult, fetching each batch on the threadpool"""
+
+    def __init__(self, result):
+        self._partitions = result.partitions()
+
+    async def partitions(self):
+        while True:
+            batch = await run_in_threadpool(next, self._partitions, None)
+            if batch is None:
+                return
+            yield batch
+
+    async def __aiter__(self):
+        async for batch in self.partitions():
+            for item in batch:
+                yield item
+
+
+class SyncSessionAdapter:
+    """
+    Awaitable facade over a blocking Session.
+
+    Exposes the subset of the AsyncSession API used by the routers, running
+    each database call on the threadpool, so handlers have one code path
+    whichever engine is configured.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, statement, params, **kwargs)
+
+    async def stream(self, statement, params=None, **kwargs):
+        result = await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+        return _ThreadedStream(result)
+
+    async def stream_scalars(self, statement, params=None, **kwargs):
+        result = await run_in_threadpool(self.sync_session.scalars, statement, params, **kwargs)
+        return _ThreadedStream(result)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def merge(self, instance, load=True):
+        return await run_in_threadpool(self.sync_session.merge, instance, load=load)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+def open_session():
+    """
+    Open a new request-independent session (AsyncSession or SyncSessionAdapter)
+    on the current branch's database
+    """
+    return get_shard().open_session()
+
+
+def open_read_session():
+    """
+    Open a new request-independent session on the current branch's read
+    engine (may lag the primary when it is a replica)
+    """
+    return get_shard().open_read_session()
+
+
+@asynccontextmanager
+async def _session(open_, sync_slots):
+    if USE_ASYNC_DB:
+        db = open_()
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+
+    async with sync_slots:
+        db = open_()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+async def get_db():
     """
     Dependency function to get DB session
     """
-    db = SessionLocal()
-    try:
+    shard = get_shard()
+    async with _session(shard.open_session, shard.session_slots) as db:
         yield db
-    finally:
-        db.close()
+
+
+async def get_read_db():
+    """
+    Dependency function to get a read-only DB session, for GET handlers
+    """
+    shard = get_shard()
+    async with _session(shard.open_read_session, shard.read_slots) as db:
+        yield db
+
+
+def sync_engines() -> list:
+    """
+    Every distinct sync Engine of every shard (async engines by their
+    sync_engine), for event hooks
+    """
+    engines = []
+    for shard in branch_shards() + [directory_shard()]:
+        for candidate in shard.sync_engines():
+            if candidate not in engines:
+                engines.append(candidate)
+    return engines
+
+
+async def dispose_engines():
+    """Release pooled connections of every engine"""
+    for shard in list(_shards.values()):
+        await shard.dispose()
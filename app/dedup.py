@@ -0,0 +1,120 @@
+"""
+De-duplication of repeated check-in scans
+
+Turnstiles and card readers double-fire and members tap twice. A member's
+check-in is remembered for CHECK_IN_DEDUP_SECONDS; a repeat scan inside
+that window gets the same attendance record back without touching the
+database (so neither a second row nor a second total_check_ins bump).
+Scans that arrive while the member's first check-in is still in flight
+wait for it instead of racing it.
+
+Clients retrying over the network can also send an Idempotency-Key header;
+its result is replayed for CHECK_IN_IDEMPOTENCY_TTL seconds, independently
+of the window.
+
+Both are per-process memory: with several workers a double-fire reaching
+two processes is not caught. Members are keyed with their branch
+(app.database.branch_scoped), since member ids repeat across shards.
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.cache import TTLCache
+
+
+class IdempotencyKeyConflict(Exception):
+    """Raised when an Idempotency-Key is reused for a different member"""
+
+
+class ScanDeduplicator:
+    """
+    Per-member check-in window and Idempotency-Key replay cache, both
+    bounded LRUs with TTL eviction
+    """
+
+    def __init__(self, window: float, key_ttl: float, maxsize: int):
+        self.window = window
+        self.duplicates = 0
+        self.replays = 0
+        self._recent = TTLCache(maxsize, window)
+        self._keys = TTLCache(maxsize, key_ttl)
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+    async def check_in(
+        self, member_id: Hashable, key: Optional[str], perform: Callable[[], Awaitable[dict]]
+    ) -> Tuple[dict, bool]:
+        """
+        Run `perform` (the actual check-in) unless this scan repeats a recent
+        or in-flight one. Returns (attendance record, duplicate).
+        """
+        if key is not None:
+            replay = self._keys.get(key)
+            if replay is not None:
+                if replay[0] != member_id:
+                    raise IdempotencyKeyConflict()
+                self.replays += 1
+                return replay[1], True
+
+        if self.window <= 0:
+            record, duplicate = await perform(), False
+        else:
+            record, duplicate = await self._within_window(member_id, perform)
+
+        if key is not None:
+            self._keys.set(key, (member_id, record))
+        return record, duplicate
+
+    async def _within_window(self, member_id: Hashable, perform) -> Tuple[dict, bool]:
+        record = self._recent.get(member_id)
+        while record is None and member_id in self._pending:
+            pending = self._pending[member_id]
+            try:
+                # Shares the first scan's outcome, including its error
+                record = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The first scan's request went away; check in ourselves
+        if record is not None:
+            self.duplicates += 1
+            return record, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[member_id] = future
+        try:
+            record = await perform()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # retrieved: nobody may be waiting
+            raise
+        finally:
+            del self._pending[member_id]
+        future.set_result(record)
+        self._recent.set(member_id, record)
+        return record, False
+
+    def forget(self, member_id: Hashable) -> None:
+        """End the member's window (after a check-out the next scan is a new visit)"""
+        self._recent.invalidate(member_id)
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {
+            "window_seconds": self.window,
+            "members": len(self._recent),
+            "keys": len(self._keys),
+            "in_flight": len(self._pending),
+            "duplicates": self.duplicates,
+            "replays": self.replays,
+        }
+
+
+scan_deduplicator = ScanDeduplicator(
+    window=float(os.getenv("CHECK_IN_DEDUP_SECONDS", "30")),
+    key_ttl=float(os.getenv("CHECK_IN_IDEMPOTENCY_TTL", "86400")),
+    maxsize=int(os.getenv("CHECK_IN_DEDUP_SIZE", "100000")),
+)
@@ -0,0 +1,163 @@
+"""
+Development diagnostics: slow-query log and N+1 detector
+
+Opt-in with DIAGNOSTICS=1. Every statement slower than
+DIAGNOSTICS_SLOW_QUERY_MS is reported with its parameters and, for
+queries and DML, the database's plan for it (EXPLAIN QUERY PLAN on SQLite,
+EXPLAIN elsewhere).
+Requests that run the same normalized statement more than
+DIAGNOSTICS_REPEAT_THRESHOLD times (typically a lazy load per row) are
+reported once per statement. Findings are written as JSON lines to
+DIAGNOSTICS_LOG (default: stderr), one object per line with an "event" of
+"slow_query" or "repeated_query", ready to aggregate from CI runs.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.metrics import TOOLING_STATEMENTS, route_template
+
+DIAGNOSTICS_ENABLED = os.getenv("DIAGNOSTICS", "0").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("DIAGNOSTICS_SLOW_QUERY_MS", "100"))
+REPEAT_THRESHOLD = int(os.getenv("DIAGNOSTICS_REPEAT_THRESHOLD", "5"))
+LOG_PATH = os.getenv("DIAGNOSTICS_LOG", "-")
+
+EXPLAIN_PREFIX = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN ", "mysql": "EXPLAIN "}
+# Statements that have a plan; DDL, PRAGMA, transaction control etc. do not
+EXPLAINABLE = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s|\$\d+|:\w+|%\(\w+\)s)\s*,?)+\)", re.IGNORECASE)
+_POSTCOMPILE = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+_NUMBERED = re.compile(r"\$\d+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Per-request statement counts; None outside requests
+current_statements: ContextVar[Optional[Counter]] = ContextVar("current_statements", default=None)
+
+
+def normalize(statement: str) -> str:
+    """Collapse whitespace and expanded IN lists so repeats compare equal"""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _POSTCOMPILE.sub("(?)", statement)
+    statement = _IN_LIST.sub("IN (?)", statement)
+    return _NUMBERED.sub("?", statement)
+
+
+class JsonLinesWriter:
+    """Thread-safe writer of one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, record: dict):
+        line = json.dumps({"ts": datetime.utcnow().isoformat() + "Z", **record}, default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = sys.stderr if self.path == "-" else open(self.path, "a", buffering=1)
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+writer = JsonLinesWriter(LOG_PATH)
+
+
+def _explain(conn, statement: str, parameters) -> list:
+    prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+    words = statement.lstrip().split(None, 1)
+    if prefix is None or not words or words[0].upper() not in EXPLAINABLE:
+        return []
+    conn.info[TOOLING_STATEMENTS] = True
+    try:
+        if conn.dialect.name == "postgresql":
+            # A failed statement aborts the whole PostgreSQL transaction;
+            # the savepoint confines that to the EXPLAIN
+            with conn.begin_nested():
+                rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        else:
+            rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    except Exception as exc:  # the plan is best effort; never fail the request
+        return [f"EXPLAIN failed: {exc}"]
+    finally:
+        conn.info[TOOLING_STATEMENTS] = False
+    # SQLite rows are (id, parent, notused, detail); others are one text column
+    return [str(row[-1]) for row in rows]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("diagnostics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["diagnostics_started"].pop()) * 1000
+    # The EXPLAIN and its savepoint are ours, not the application's
+    if conn.info.get(TOOLING_STATEMENTS):
+        return
+
+    statements = current_statements.get()
+    if statements is not None:
+        statements[normalize(statement)] += 1
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        writer.write({
+            "event": "slow_query",
+            "duration_ms": round(elapsed_ms, 2),
+            "statement": statement,
+            "parameters": parameters if not executemany else f"<executemany: {len(parameters)} rows>",
+            "plan": [] if executemany else _explain(conn, statement, parameters),
+        })
+
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("diagnostics_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def install_query_hooks(engine):
+    """Watch every statement executed through `engine` (a sync Engine)"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class DiagnosticsMiddleware:
+    """Pure ASGI middleware reporting statements a request repeats too often"""
+
+    def __init__(self, app, threshold: int = REPEAT_THRESHOLD):
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        statements = Counter()
+        token = current_statements.set(statements)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_statements.reset(token)
+            for statement, count in statements.items():
+                if count > self.threshold:
+                    writer.write({
+                        "event": "repeated_query",
+                        "method": scope["method"],
+                        "route": route_template(scope),
+                        "path": scope["path"],
+                        "count": count,
+                        "statement": statement,
+                    })
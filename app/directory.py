@@ -0,0 +1,164 @@
+"""
+Global member directory for multi-branch deployments
+
+With BRANCH_SHARDS set, each branch's members live in that branch's shard,
+so a phone number alone does not say where to look. `member_directory`
+(phone -> branch, member_id), kept in the DATABASE_URL database, answers
+that with one primary-key lookup instead of a query on every shard.
+
+Member creation and import add the entry right after the shard insert.
+The directory's primary key keeps phones unique across branches: when
+another branch already holds the phone, the new member is removed again.
+Without sharding the directory is not used and lookups go straight to the
+members table.
+
+Rebuild it from every shard (after adding a branch, or if a process died
+between the two writes) with:
+
+    python -m app.directory [--batch-size N]
+"""
+import argparse
+import logging
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.database import (
+    BRANCHES, SHARDING_ENABLED, current_branch, directory_shard, get_shard, open_read_session, use_branch
+)
+from app.models import Member
+
+logger = logging.getLogger(__name__)
+
+# Lives in the directory database only, not in the branch shards
+directory_metadata = MetaData()
+
+member_directory = Table(
+    "member_directory",
+    directory_metadata,
+    Column("phone", String(20), primary_key=True),
+    Column("branch", String(50), nullable=False),
+    Column("member_id", Integer, nullable=False),
+)
+
+
+def create_directory(engine):
+    directory_metadata.create_all(bind=engine)
+
+
+async def lookup_phone(phone: str) -> Optional[Tuple[str, int]]:
+    """(branch, member_id) registered for `phone`, or None"""
+    db = directory_shard().open_read_session()
+    try:
+        row = (await db.execute(
+            select(member_directory.c.branch, member_directory.c.member_id)
+            .where(member_directory.c.phone == phone)
+        )).first()
+    finally:
+        await db.close()
+    return tuple(row) if row is not None else None
+
+
+async def registered_phones(phones: Iterable[str]) -> Set[str]:
+    """The subset of `phones` already held by some branch"""
+    db = directory_shard().open_read_session()
+    try:
+        return set((await db.scalars(
+            select(member_directory.c.phone).where(member_directory.c.phone.in_(list(phones)))
+        )).all())
+    finally:
+        await db.close()
+
+
+async def register_members(members: List[Tuple[str, int]], branch: Optional[str] = None):
+    """
+    Add (phone, member_id) entries for `branch` (default: the current
+    branch) in one transaction; raises IntegrityError if a phone is taken
+    """
+    branch = branch or current_branch.get()
+    db = directory_shard().open_session()
+    try:
+        await db.execute(insert(member_directory), [
+            {"phone": phone, "branch": branch, "member_id": member_id} for phone, member_id in members
+        ])
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
+
+
+async def find_member(phone: str) -> Optional[Tuple[str, Member]]:
+    """
+    (branch, member) for `phone`, reading only the member's own shard, or
+    None when no branch has it
+    """
+    if not SHARDING_ENABLED:
+        branch, member_id = current_branch.get(), None
+    else:
+        entry = await lookup_phone(phone)
+        if entry is None:
+            return None
+        branch, member_id = entry
+
+    with use_branch(branch):
+        db = open_read_session()
+        try:
+            if member_id is None:
+                member = await db.scalar(select(Member).where(Member.phone == phone))
+            else:
+                member = await db.get(Member, member_id)
+        finally:
+            await db.close()
+    return (branch, member) if member is not None else None
+
+
+def rebuild_directory(batch_size: int = 10000) -> Tuple[int, int]:
+    """
+    Refill the directory from the members of every branch in one
+    transaction. Returns (entries written, phones skipped because an
+    earlier branch already holds them).
+    """
+    engine = directory_shard().engine
+    directory_insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+    read = 0
+    seen = []
+
+    with engine.begin() as connection:
+        directory_metadata.create_all(bind=connection)
+        connection.execute(delete(member_directory))
+        for branch in BRANCHES:
+            shard = get_shard(branch)
+            if shard in seen:
+                continue
+            seen.append(shard)
+            with shard.read_engine.connect() as source:
+                result = source.execution_options(yield_per=batch_size).execute(
+                    select(Member.phone, Member.id).order_by(Member.id)
+                )
+                for rows in result.partitions():
+                    connection.execute(
+                        directory_insert(member_directory).on_conflict_do_nothing(index_elements=["phone"]),
+                        [{"phone": phone, "branch": branch, "member_id": member_id} for phone, member_id in rows]
+                    )
+                    read += len(rows)
+            logger.info("Indexed branch %s (%d members read so far)", branch, read)
+        written = connection.scalar(select(func.count()).select_from(member_directory))
+    return written, read - written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the cross-branch member directory from every shard")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Members read per round trip")
+    args = parser.parse_args()
+
+    written, skipped = rebuild_directory(args.batch_size)
+    print(f"Indexed {written} members across {len(BRANCHES)} branches")
+    if skipped:
+        print(f"Skipped {skipped} phones registered in more than one branch")
+
+
+if __name__ == "__main__":
+    main()
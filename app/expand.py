@@ -0,0 +1,53 @@
+"""
+`expand` query parameter handling for nested response objects
+"""
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import raiseload, selectinload
+
+from app.serialization import object_dicts
+
+
+def parse_expand(expand: Optional[str], allowed: List[str]) -> set:
+    """
+    Parse a comma-separated `expand` value, rejecting unknown names
+    """
+    if not expand:
+        return set()
+    names = {name.strip() for name in expand.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid expand value: {', '.join(sorted(unknown))} (allowed: {', '.join(allowed)})"
+        )
+    return names
+
+
+def relationship_options(relationships: Dict[str, object], expand: set) -> list:
+    """
+    Loader options that batch-load expanded relationships with one SELECT
+    each and forbid loading the rest, so responses never trigger per-row
+    lazy loads (serialize the objects with expanded_dicts)
+    """
+    return [
+        selectinload(attribute) if name in expand else raiseload(attribute)
+        for name, attribute in relationships.items()
+    ]
+
+
+def expanded_dicts(objects: Iterable, columns: list, nested: Dict[str, list], expand: set) -> List[dict]:
+    """
+    Response dicts of `objects` (see object_dicts) with each relationship
+    in `nested` (name -> its response columns) included when expanded and
+    null otherwise
+    """
+    dicts = []
+    for obj in objects:
+        item = object_dicts([obj], columns)[0]
+        for name, nested_columns in nested.items():
+            related = getattr(obj, name) if name in expand else None
+            item[name] = object_dicts([related], nested_columns)[0] if related is not None else None
+        dicts.append(item)
+    return dicts
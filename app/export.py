@@ -0,0 +1,182 @@
+"""
+Bulk export of attendance and subscriptions
+
+Rows are streamed as CSV or NDJSON (optionally gzip-compressed) straight
+from a server-side cursor, EXPORT_BATCH_SIZE rows at a time, so memory
+stays flat however large the table is. Attendance includes archived
+check-ins.
+
+Exports can be incremental: each one reports a watermark (its start time
+minus EXPORT_WATERMARK_LAG, which leaves in-flight transactions time to
+commit), and passing it back as `since` returns only rows created
+(attendance, by created_at) or changed (subscriptions, by updated_at)
+after it. Delivery is at-least-once; consumers should upsert on `id`.
+Check-outs recorded after a check-in was exported do not re-export it.
+
+The same streams back the /exports endpoints and the CLI:
+
+    python -m app.export attendance|subscriptions [--format csv|ndjson] [--gzip]
+                                                  [--since ISO | --state-file PATH] [--output PATH]
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import sys
+import zlib
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import or_, select
+
+from app.archive import archive_source
+from app.database import dialect_name, dispose_engines, open_read_session
+from app.models import Attendance, AttendanceArchiveMonth, Subscription
+from app.serialization import dumps, row_dicts
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+WATERMARK_LAG = float(os.getenv("EXPORT_WATERMARK_LAG", "60"))
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# Export name -> (table, watermark column name)
+EXPORTS = {
+    "attendance": (Attendance.__table__, "created_at"),
+    "subscriptions": (Subscription.__table__, "updated_at"),
+}
+
+
+def watermark(now: Optional[datetime] = None) -> datetime:
+    """Upper bound of an export starting now; the next run's `since`"""
+    return (now or datetime.utcnow()) - timedelta(seconds=WATERMARK_LAG)
+
+
+async def _sources(db, name: str, since: Optional[datetime]) -> list:
+    table, _ = EXPORTS[name]
+    sources = [table]
+    if name == "attendance":
+        # Only months the archive job touched since the last export can hold
+        # rows created after it
+        query = select(AttendanceArchiveMonth.month)
+        if since is not None:
+            query = query.where(AttendanceArchiveMonth.archived_at > since)
+        archive = archive_source(dialect_name(), list((await db.scalars(query)).all()))
+        if archive is not None:
+            sources.append(archive)
+    return sources
+
+
+def _query(source, watermark_key: str, since: Optional[datetime], until: datetime):
+    column = source.c[watermark_key]
+    query = select(*source.c)
+    if since is None:
+        # Rows written while the dump streams belong to the next delta,
+        # which starts at `until`; rows without a watermark are dumped
+        return query.where(or_(column <= until, column.is_(None))).order_by(source.c.id)
+    return query.where(column > since, column <= until).order_by(column, source.c.id)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def export_rows(
+    db, name: str, format: str, since: Optional[datetime] = None, until: Optional[datetime] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yield the export as encoded chunks, one per fetched batch.
+
+    `db` must stay open until the generator is exhausted.
+    """
+    table, watermark_key = EXPORTS[name]
+    columns = list(table.c)
+    until = until or watermark()
+    if format == "csv":
+        yield ",".join(column.key for column in columns).encode() + b"\n"
+
+    for source in await _sources(db, name, since):
+        query = _query(source, watermark_key, since, until).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            if format == "csv":
+                yield _encode_csv(rows)
+            else:
+                yield b"".join(dumps(record) + b"\n" for record in row_dicts(rows, columns))
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compress a byte stream into one gzip member as it goes"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _read_state(path: str) -> Optional[datetime]:
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return datetime.fromisoformat(value) if value else None
+
+
+async def _export_to_file(args, since: Optional[datetime], until: datetime):
+    db = open_read_session()
+    output = open(args.output, "wb") if args.output != "-" else sys.stdout.buffer
+    try:
+        chunks = export_rows(db, args.name, args.format, since, until)
+        if args.gzip:
+            chunks = gzip_chunks(chunks)
+        async for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        await db.close()
+        await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a full or incremental export to a file")
+    parser.add_argument("name", choices=sorted(EXPORTS))
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Watermark of the previous export")
+    parser.add_argument(
+        "--state-file",
+        help="Read --since from this file and store the new watermark in it after a successful export"
+    )
+    parser.add_argument("--output", default="-", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    since = args.since
+    if since is None and args.state_file:
+        since = _read_state(args.state_file)
+    until = watermark()
+
+    asyncio.run(_export_to_file(args, since, until))
+
+    if args.state_file:
+        with open(args.state_file, "w") as f:
+            f.write(until.isoformat() + "\n")
+    print(f"Exported {args.name} {'since ' + since.isoformat() if since else '(full)'}; "
+          f"watermark {until.isoformat()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,24 @@ Main FastAPI application entry point
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
-from app.routers import members, plans, subscriptions, attendance
+from fastapi.responses import PlainTextResponse
+from app import admission, diagnostics, metrics
+from app.archive import install_archive_columns
+from app.branches import BranchMiddleware
+from app.cache import plan_catalog, subscription_windows
+from app.counters import install_check_in_trigger
+from app.database import (
+    SHARDING_ENABLED, Base, branch_shards, directory_shard, dispose_engines, sync_engines
+)
+from app.directory import create_directory
+from app.models import install_columns, install_indexes
+from app.dedup import scan_deduplicator
+from app.occupancy import occupancy
+from app.rollups import install_rollup_trigger
+from app.search import install_member_search_index
+from app.routers import members, plans, subscriptions, attendance, exports
+from app.sweeper import subscription_sweeper
+from app.write_behind import attendance_queue
 
 app = FastAPI(
     title="Service Membership System API",
@@ -12,6 +28,15 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Concurrency limits and load shedding; added first so shed responses still
+# pass through CORS and are counted by the metrics middleware
+if admission.ADMISSION_ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware)
+
+# Route each request to its branch's database (X-Branch-Id)
+if SHARDING_ENABLED:
+    app.add_middleware(BranchMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -21,17 +46,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency and per-request SQL metrics
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware, server_timing=metrics.SERVER_TIMING)
+    for hooked in sync_engines():
+        metrics.install_query_hooks(hooked)
+    metrics.register_stats("subscription_cache", subscription_windows.stats)
+    metrics.register_stats("plan_catalog", plan_catalog.stats)
+    metrics.register_stats("attendance_queue", attendance_queue.stats)
+    metrics.register_stats("subscription_sweeper", subscription_sweeper.stats)
+    metrics.register_stats("occupancy", occupancy.stats)
+    metrics.register_stats("check_in_dedup", scan_deduplicator.stats)
+    if admission.ADMISSION_ENABLED:
+        metrics.register_stats("admission", admission.admission_controller.stats)
+
+# Slow-query log and N+1 detector (development only)
+if diagnostics.DIAGNOSTICS_ENABLED:
+    app.add_middleware(diagnostics.DiagnosticsMiddleware)
+    for hooked in sync_engines():
+        diagnostics.install_query_hooks(hooked)
+
 # Include routers
 app.include_router(members.router, prefix="/members", tags=["Members"])
 app.include_router(plans.router, prefix="/plans", tags=["Plans"])
 app.include_router(subscriptions.router, prefix="/subscriptions", tags=["Subscriptions"])
 app.include_router(attendance.router, prefix="/attendance", tags=["Attendance"])
+app.include_router(exports.router, prefix="/exports", tags=["Exports"])
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Create database tables on startup"""
-    Base.metadata.create_all(bind=engine)
+    """Create database tables, columns, indexes, triggers and search indexes on startup (in every branch shard)"""
+    for shard in branch_shards():
+        shard.create_schema()
+        Base.metadata.create_all(bind=shard.engine)
+        with shard.engine.begin() as connection:
+            install_columns(connection)
+            install_archive_columns(connection)
+            install_indexes(connection)
+            install_check_in_trigger(connection)
+            install_rollup_trigger(connection)
+            install_member_search_index(connection)
+    if SHARDING_ENABLED:
+        create_directory(directory_shard().engine)
+    await attendance_queue.start()
+    await subscription_sweeper.start()
+    await occupancy.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued check-ins and release pooled database connections"""
+    await occupancy.stop()
+    await subscription_sweeper.stop()
+    await attendance_queue.stop()
+    await dispose_engines()
 
 
 @app.get("/", tags=["Root"])
@@ -48,4 +117,10 @@ async def root():
 @app.get("/health", tags=["Root"])
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse, include_in_schema=metrics.METRICS_ENABLED)
+async def get_metrics():
+    """Prometheus metrics (request latency, SQL activity, caches and queues)"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
\ No newline at end of file
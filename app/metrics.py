@@ -0,0 +1,243 @@
+"""
+Request and SQL instrumentation, exposed in Prometheus text format
+
+MetricsMiddleware records a latency histogram per route template, method
+and status. Cursor-execute hooks on the engines count statements and time
+spent in the database, both globally and for the request that issued them
+(tracked through a context variable, which follows the request into the
+threadpool and into the async driver's greenlet). With
+METRICS_SERVER_TIMING=1 each response carries a Server-Timing header
+splitting its time into database and application (handler, serialization)
+parts.
+
+Component counters (cache, write-behind queue, occupancy, ...) are
+registered with register_stats() and rendered as gauges.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestStats:
+    """SQL activity of one request"""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, [list(series[0]), series[1], series[2]]) for labels, series in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labels, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    REQUEST_BUCKETS, ("method", "route", "status"),
+)
+request_queries = Counter(
+    "http_request_db_queries_total", "SQL statements issued by requests, by route", ("method", "route"),
+)
+request_db_seconds = Counter(
+    "http_request_db_seconds_total", "Time requests spent in SQL statements, by route", ("method", "route"),
+)
+query_latency = Histogram("db_query_duration_seconds", "SQL statement latency", QUERY_BUCKETS)
+
+_stats_sources: Dict[str, Callable[[], dict]] = {}
+
+
+def register_stats(name: str, stats: Callable[[], dict]):
+    """Render the numeric fields of `stats()` as `<name>_<field>` gauges"""
+    _stats_sources[name] = stats
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in (request_latency, request_queries, request_db_seconds, query_latency):
+        lines.extend(metric.render())
+    for name, stats in _stats_sources.items():
+        for key, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f"# TYPE {name}_{key} gauge")
+            lines.append(f"{name}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# conn.info flag set while tooling (the diagnostics EXPLAIN) runs statements
+# of its own on a connection; those are not the application's queries
+TOOLING_STATEMENTS = "tooling_statements"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    if conn.info.get(TOOLING_STATEMENTS):
+        return
+    query_latency.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not fire for failed statements
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def install_query_hooks(engine):
+    """Time every statement executed through `engine` (a sync Engine)"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request latency and per-request SQL
+    activity (labelled by route template to bound cardinality)
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    total = time.perf_counter() - started
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(stats, total).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            route = route_template(scope)
+            method = scope["method"]
+            request_latency.observe(time.perf_counter() - started, method, route, str(status))
+            request_queries.inc(stats.queries, method, route)
+            request_db_seconds.inc(stats.db_seconds, method, route)
+
+
+def route_template(scope) -> str:
+    """
+    The matched route's path template, e.g. /members/{member_id}: path
+    segments holding a path parameter value are replaced by its name
+    """
+    if scope.get("route") is None:
+        return "unmatched"
+    params = {str(value): name for name, value in scope.get("path_params", {}).items()}
+    if not params:
+        return scope["path"]
+    return "/".join(f"{{{params[segment]}}}" if segment in params else segment for segment in scope["path"].split("/"))
+
+
+def _server_timing(stats: RequestStats, total: float) -> str:
+    db_ms = stats.db_seconds * 1000
+    app_ms = max(total * 1000 - db_ms, 0.0)
+    return f'db;dur={db_ms:.2f};desc="{stats.queries} queries", app;dur={app_ms:.2f}, total;dur={total * 1000:.2f}'
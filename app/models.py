@@ -1,7 +1,9 @@
 """
 SQLAlchemy ORM models for database tables
 """
-from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Numeric, CheckConstraint
+from sqlalchemy import (
+    Column, Integer, String, DateTime, Date, ForeignKey, Numeric, CheckConstraint, Index, inspect, literal, text
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -59,7 +61,7 @@ class Subscription(Base):
     __tablename__ = "subscriptions"
 
     id = Column(Integer, primary_key=True, index=True)
-    member_id = Column(Integer, ForeignKey("members.id", ondelete="CASCADE"), nullable=False, index=True)
+    member_id = Column(Integer, ForeignKey("members.id", ondelete="CASCADE"), nullable=False)
     plan_id = Column(Integer, ForeignKey("plans.id", ondelete="RESTRICT"), nullable=False, index=True)
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=False, index=True)
@@ -71,10 +73,18 @@ class Subscription(Base):
     member = relationship("Member", back_populates="subscriptions")
     plan = relationship("Plan", back_populates="subscriptions")
 
-    # Constraints
+    # Constraints and indexes
     __table_args__ = (
         CheckConstraint("end_date >= start_date", name="check_subscription_dates"),
         CheckConstraint("status IN ('active', 'expired', 'cancelled')", name="check_subscription_status"),
+        # Covers the check-in / current-subscription window lookup
+        Index("ix_subscriptions_member_status_end", member_id, status, end_date, start_date),
+        # Expiry sweeper walk and status-filtered listings
+        Index("ix_subscriptions_status_end", status, end_date),
+        Index("ix_subscriptions_status_created", status, created_at),
+        Index("ix_subscriptions_created", created_at),
+        # Incremental exports walk changes in watermark order
+        Index("ix_subscriptions_updated", updated_at, id),
     )
 
 
@@ -83,11 +93,141 @@ class Attendance(Base):
     __tablename__ = "attendance"
 
     id = Column(Integer, primary_key=True, index=True)
-    member_id = Column(Integer, ForeignKey("members.id", ondelete="CASCADE"), nullable=False, index=True)
+    member_id = Column(Integer, ForeignKey("members.id", ondelete="CASCADE"), nullable=False)
     check_in_time = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
     check_out_time = Column(DateTime, nullable=True)
     notes = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Plan of the subscription the check-in was admitted on (feeds the
+    # per-plan rollups); NULL for rows written before it was recorded
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="SET NULL"), nullable=True)
 
     # Relationships
-    member = relationship("Member", back_populates="attendances")
\ No newline at end of file
+    member = relationship("Member", back_populates="attendances")
+
+    # Indexes
+    __table_args__ = (
+        # Per-member history; scanned backwards for newest-first pages, which
+        # also yields the id tiebreak in order (SQLite appends rowid ASC)
+        Index("ix_attendance_member_check_in", member_id, check_in_time),
+        # Open sessions only (people on the floor), so occupancy counts and
+        # the stale-session sweep never touch closed history
+        Index(
+            "ix_attendance_open_sessions", check_in_time, member_id,
+            sqlite_where=check_out_time.is_(None),
+            postgresql_where=check_out_time.is_(None),
+        ),
+        # Incremental exports walk new check-ins in watermark order
+        Index("ix_attendance_created", created_at, id),
+        # Archiving can delete the highest ids; never hand them out again,
+        # since archived rows keep theirs. Only applies to attendance tables
+        # created with it: SQLite cannot add AUTOINCREMENT to an existing one
+        {"sqlite_autoincrement": True},
+    )
+
+# ========== Attendance rollups (maintained by app.rollups triggers) ==========
+class AttendanceHourly(Base):
+    """Check-ins per hour (hour truncated, UTC)"""
+    __tablename__ = "attendance_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+class AttendanceDaily(Base):
+    """Check-ins per day (UTC)"""
+    __tablename__ = "attendance_daily"
+
+    day = Column(Date, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+class AttendanceMemberMonthly(Base):
+    """Check-ins per member per month (month stored as its first day)"""
+    __tablename__ = "attendance_member_monthly"
+
+    member_id = Column(Integer, ForeignKey("members.id", ondelete="CASCADE"), primary_key=True)
+    month = Column(Date, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+class AttendancePlanHourly(Base):
+    """Check-ins per hour per plan (hour truncated, UTC)"""
+    __tablename__ = "attendance_plan_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+class AttendancePlanDaily(Base):
+    """Check-ins per day per plan (UTC)"""
+    __tablename__ = "attendance_plan_daily"
+
+    day = Column(Date, primary_key=True)
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+class AttendanceArchiveMonth(Base):
+    """Months of check-ins moved to archive storage by app.archive"""
+    __tablename__ = "attendance_archive_months"
+
+    month = Column(Date, primary_key=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+def add_missing_columns(connection, table):
+    """
+    Add columns of `table` missing from its existing database table.
+    Existing rows get the column's scalar default (NOT NULL is kept only
+    when there is one); foreign keys on added columns are not created.
+    """
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=connection.dialect)}"
+        if column.default is not None and column.default.is_scalar:
+            default = literal(column.default.arg, column.type).compile(
+                dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+            )
+            ddl += f" DEFAULT {default}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+        connection.execute(text(ddl))
+
+
+def install_columns(connection):
+    """
+    Add model columns missing from existing tables (create_all skips
+    tables that already exist, so older databases would never get them)
+    """
+    for table in Base.metadata.sorted_tables:
+        add_missing_columns(connection, table)
+
+
+def install_indexes(connection):
+    """
+    Create model indexes missing from existing tables (create_all skips
+    tables that already exist, so older databases would never get them)
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def postgres_trigger_current(connection, trigger: str, table: str, function_body: str) -> bool:
+    """
+    Whether `table` already has `trigger` calling a function whose body is
+    `function_body`, so its (table-locking) DDL can be skipped. Workers
+    starting together are serialized on an advisory lock until commit, so
+    only the first one installs it.
+    """
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:trigger))"), {"trigger": trigger})
+    installed = connection.scalar(text(
+        "SELECT p.prosrc FROM pg_trigger t JOIN pg_proc p ON p.oid = t.tgfoid "
+        "WHERE t.tgname = :trigger AND t.tgrelid = to_regclass(:table)"
+    ), {"trigger": trigger, "table": table})
+    return installed is not None and installed.strip() == function_body.strip()
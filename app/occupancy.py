@@ -0,0 +1,207 @@
+"""
+Live floor occupancy
+
+Occupancy is the number of open attendance sessions (checked in, not yet
+checked out). A member has at most one: a check-in closes their earlier
+open session at its own check-in time. The count is kept in memory,
+adjusted by check-in and check-out, and recounted from the open-sessions
+partial index at startup and every OCCUPANCY_SWEEP_INTERVAL (after the
+stale-session sweep, when auto-close is on), which also corrects drift
+between workers. Each branch has its own count; sweeps cover every branch.
+
+Sessions left open longer than OCCUPANCY_STALE_HOURS (members who never
+scanned out) are closed by the sweep with check_out_time set to
+check_in_time + OCCUPANCY_STALE_HOURS. Run one sweep from the command line
+with:
+
+    python -m app.occupancy
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, select, update
+
+from app.database import BRANCHES, current_branch, open_session, use_branch
+from app.models import Attendance
+
+logger = logging.getLogger(__name__)
+
+OPEN_SESSION = Attendance.check_out_time.is_(None)
+
+# Executemany close of one open session per parameter set
+CLOSE_SESSION = (
+    update(Attendance.__table__)
+    .where(Attendance.__table__.c.id == bindparam("session_id"), Attendance.__table__.c.check_out_time.is_(None))
+    .values(check_out_time=bindparam("closed_at"))
+)
+
+
+async def count_open_sessions(db) -> int:
+    return await db.scalar(select(func.count()).select_from(Attendance).where(OPEN_SESSION))
+
+
+async def close_stale_sessions(db, stale_after: timedelta, batch_size: int) -> int:
+    """
+    Close sessions checked in before now - `stale_after`, in batches.
+    Returns the number of sessions closed.
+    """
+    closed = 0
+    cutoff = datetime.utcnow() - stale_after
+    while True:
+        rows = (await db.execute(
+            select(Attendance.id, Attendance.check_in_time)
+            .where(OPEN_SESSION, Attendance.check_in_time < cutoff)
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            return closed
+        await db.execute(CLOSE_SESSION, [
+            {"session_id": session_id, "closed_at": check_in_time + stale_after}
+            for session_id, check_in_time in rows
+        ])
+        await db.commit()
+        closed += len(rows)
+
+
+async def close_superseded_sessions(db, values: list) -> int:
+    """
+    Leave each member in `values` (attendance rows about to be inserted)
+    with one open session, the newest of their open sessions and new
+    check-ins. Earlier ones end where the next one starts: open sessions
+    are closed in the database, new rows get their check_out_time set in
+    `values`. Returns the change in open sessions once `values` is inserted.
+    """
+    existing = (await db.execute(
+        select(Attendance.id, Attendance.member_id, Attendance.check_in_time)
+        .where(OPEN_SESSION, Attendance.member_id.in_({item["member_id"] for item in values}))
+    )).all()
+
+    # member_id -> [(check_in_time, order, open session id or new row)]
+    sessions = defaultdict(list)
+    for session_id, member_id, check_in_time in existing:
+        sessions[member_id].append((check_in_time, len(sessions[member_id]), session_id))
+    for item in values:
+        item["check_out_time"] = None
+        sessions[item["member_id"]].append((item["check_in_time"], len(sessions[item["member_id"]]), item))
+
+    closes = []
+    for member_sessions in sessions.values():
+        member_sessions.sort(key=lambda session: session[:2])
+        for (_, _, session), (next_start, _, _) in zip(member_sessions, member_sessions[1:]):
+            if isinstance(session, dict):
+                session["check_out_time"] = next_start
+            else:
+                closes.append({"session_id": session, "closed_at": next_start})
+    if closes:
+        await db.execute(CLOSE_SESSION, closes)
+    return len(sessions) - len(existing)
+
+
+class OccupancyTracker:
+    """
+    In-memory count of open sessions plus the periodic stale-session sweep
+    """
+
+    def __init__(self, auto_close: bool, stale_after_hours: float, interval: float, batch_size: int):
+        self.auto_close = auto_close
+        self.stale_after = timedelta(hours=stale_after_hours)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.counts = dict.fromkeys(BRANCHES, 0)
+        self.rebuilt_at = None
+        self.auto_closed = 0
+        self._task = None
+
+    @property
+    def current(self) -> int:
+        """Open sessions of the current branch"""
+        return self.counts[current_branch.get()]
+
+    def checked_in(self, count: int = 1):
+        """Add `count` opened sessions (negative when check-ins closed more than they opened)"""
+        branch = current_branch.get()
+        self.counts[branch] = max(self.counts[branch] + count, 0)
+
+    def checked_out(self, count: int = 1):
+        branch = current_branch.get()
+        self.counts[branch] = max(self.counts[branch] - count, 0)
+
+    async def rebuild(self) -> int:
+        """Recount open sessions of every branch from the database; returns the total"""
+        for branch in BRANCHES:
+            with use_branch(branch):
+                db = open_session()
+                try:
+                    self.counts[branch] = await count_open_sessions(db)
+                finally:
+                    await db.close()
+        self.rebuilt_at = datetime.utcnow()
+        return sum(self.counts.values())
+
+    async def sweep(self) -> int:
+        """Close stale sessions in every branch, then recount"""
+        closed = 0
+        for branch in BRANCHES:
+            with use_branch(branch):
+                db = open_session()
+                try:
+                    closed += await close_stale_sessions(db, self.stale_after, self.batch_size)
+                finally:
+                    await db.close()
+        self.auto_closed += closed
+        await self.rebuild()
+        return closed
+
+    async def start(self):
+        """Load the counter and start the periodic sweep or recount"""
+        await self.rebuild()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the periodic task"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "current": self.current,
+            "total": sum(self.counts.values()),
+            "rebuilt_at": self.rebuilt_at,
+            "auto_close": self.auto_close,
+            "stale_after_hours": self.stale_after.total_seconds() / 3600,
+            "auto_closed": self.auto_closed,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.auto_close:
+                    await self.sweep()
+                else:
+                    await self.rebuild()
+            except Exception:
+                logger.exception("Stale attendance session sweep / occupancy recount failed")
+
+
+occupancy = OccupancyTracker(
+    auto_close=os.getenv("OCCUPANCY_AUTO_CLOSE", "1").lower() in ("1", "true", "yes"),
+    stale_after_hours=float(os.getenv("OCCUPANCY_STALE_HOURS", "4")),
+    interval=float(os.getenv("OCCUPANCY_SWEEP_INTERVAL", "300")),
+    batch_size=int(os.getenv("OCCUPANCY_SWEEP_BATCH_SIZE", "1000")),
+)
+
+
+if __name__ == "__main__":
+    count = asyncio.run(occupancy.sweep())
+    print(f"Closed {count} stale sessions; {sum(occupancy.counts.values())} open")
@@ -0,0 +1,224 @@
+"""
+Attendance rollups
+
+attendance_hourly, attendance_daily and attendance_member_monthly hold
+check-in counts per hour, per day and per member per month;
+attendance_plan_hourly and attendance_plan_daily split the hourly and daily
+counts by the plan recorded on each check-in. An AFTER INSERT trigger on
+attendance, installed at startup for the active dialect, bumps them in the
+same transaction as the check-in, so every write path (single, bulk,
+write-behind) keeps them current. Each branch shard keeps its own rollups,
+so the branch dimension is the shard they are read from. Archiving moves
+rows without touching the rollups, so they keep counting archived
+check-ins; deleted rows are not subtracted either.
+
+rebuild_rollups() recomputes them in batches from the attendance table and
+the archive (app.archive), for existing databases or after the trigger
+was missing:
+
+    python -m app.rollups [--batch-size N]
+"""
+import argparse
+import logging
+
+from sqlalchemy import Date, cast, delete, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.archive import all_archive_sources
+from app.models import (
+    Attendance, AttendanceDaily, AttendanceHourly, AttendanceMemberMonthly, AttendancePlanDaily, AttendancePlanHourly,
+    postgres_trigger_current
+)
+
+ROLLUPS = (AttendanceHourly, AttendanceDaily, AttendanceMemberMonthly, AttendancePlanHourly, AttendancePlanDaily)
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_NAME = "attendance_rollup_trigger"
+
+POSTGRES_FUNCTION_BODY = """
+        BEGIN
+            INSERT INTO attendance_hourly (hour, visits)
+            VALUES (date_trunc('hour', NEW.check_in_time), 1)
+            ON CONFLICT (hour) DO UPDATE SET visits = attendance_hourly.visits + 1;
+            INSERT INTO attendance_daily (day, visits)
+            VALUES (NEW.check_in_time::date, 1)
+            ON CONFLICT (day) DO UPDATE SET visits = attendance_daily.visits + 1;
+            INSERT INTO attendance_member_monthly (member_id, month, visits)
+            VALUES (NEW.member_id, date_trunc('month', NEW.check_in_time)::date, 1)
+            ON CONFLICT (member_id, month) DO UPDATE SET visits = attendance_member_monthly.visits + 1;
+            IF NEW.plan_id IS NOT NULL THEN
+                INSERT INTO attendance_plan_hourly (hour, plan_id, visits)
+                VALUES (date_trunc('hour', NEW.check_in_time), NEW.plan_id, 1)
+                ON CONFLICT (hour, plan_id) DO UPDATE SET visits = attendance_plan_hourly.visits + 1;
+                INSERT INTO attendance_plan_daily (day, plan_id, visits)
+                VALUES (NEW.check_in_time::date, NEW.plan_id, 1)
+                ON CONFLICT (day, plan_id) DO UPDATE SET visits = attendance_plan_daily.visits + 1;
+            END IF;
+            RETURN NEW;
+        END;
+"""
+
+# Bucket expressions must match how each dialect stores DateTime / Date
+# columns, so trigger-written keys compare equal to ORM-written ones
+TRIGGER_DDL = {
+    "sqlite": [
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME}",
+        f"""
+        CREATE TRIGGER {TRIGGER_NAME}
+        AFTER INSERT ON attendance
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO attendance_hourly (hour, visits)
+            VALUES (strftime('%Y-%m-%d %H:00:00.000000', NEW.check_in_time), 1)
+            ON CONFLICT (hour) DO UPDATE SET visits = visits + 1;
+            INSERT INTO attendance_daily (day, visits)
+            VALUES (date(NEW.check_in_time), 1)
+            ON CONFLICT (day) DO UPDATE SET visits = visits + 1;
+            INSERT INTO attendance_member_monthly (member_id, month, visits)
+            VALUES (NEW.member_id, strftime('%Y-%m-01', NEW.check_in_time), 1)
+            ON CONFLICT (member_id, month) DO UPDATE SET visits = visits + 1;
+            INSERT INTO attendance_plan_hourly (hour, plan_id, visits)
+            SELECT strftime('%Y-%m-%d %H:00:00.000000', NEW.check_in_time), NEW.plan_id, 1
+            WHERE NEW.plan_id IS NOT NULL
+            ON CONFLICT (hour, plan_id) DO UPDATE SET visits = visits + 1;
+            INSERT INTO attendance_plan_daily (day, plan_id, visits)
+            SELECT date(NEW.check_in_time), NEW.plan_id, 1
+            WHERE NEW.plan_id IS NOT NULL
+            ON CONFLICT (day, plan_id) DO UPDATE SET visits = visits + 1;
+        END
+        """,
+    ],
+    "postgresql": [
+        f"""
+        CREATE OR REPLACE FUNCTION attendance_rollup()
+        RETURNS TRIGGER AS $$
+        {POSTGRES_FUNCTION_BODY}
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON attendance",
+        f"""
+        CREATE TRIGGER {TRIGGER_NAME}
+        AFTER INSERT ON attendance
+        FOR EACH ROW
+        EXECUTE FUNCTION attendance_rollup()
+        """,
+    ],
+}
+
+
+def install_rollup_trigger(connection) -> bool:
+    """
+    Install the rollup trigger for the connection's dialect.
+
+    Returns False (and logs a warning) for dialects without a trigger.
+    """
+    statements = TRIGGER_DDL.get(connection.dialect.name)
+    if statements is None:
+        logger.warning(
+            "No attendance rollup trigger for dialect %s; run python -m app.rollups to refresh stats",
+            connection.dialect.name,
+        )
+        return False
+
+    if connection.dialect.name == "postgresql" and postgres_trigger_current(
+        connection, TRIGGER_NAME, "attendance", POSTGRES_FUNCTION_BODY
+    ):
+        # Re-creating it would lock attendance against check-ins
+        return True
+    for statement in statements:
+        connection.execute(text(statement))
+    return True
+
+
+def _buckets(dialect: str, column):
+    """(hour, day, month) expressions over a check_in_time column"""
+    if dialect == "postgresql":
+        return (
+            func.date_trunc("hour", column),
+            cast(column, Date),
+            cast(func.date_trunc("month", column), Date),
+        )
+    return (
+        func.strftime("%Y-%m-%d %H:00:00.000000", column),
+        func.date(column),
+        func.strftime("%Y-%m-01", column),
+    )
+
+
+def _upsert_counts(dialect: str, model, keys: list, counts):
+    """INSERT ... SELECT the grouped counts, adding to existing rollup rows"""
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(model).from_select([*keys, "visits"], counts)
+    return statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={"visits": model.visits + statement.excluded.visits},
+    )
+
+
+def _count_range(connection, source, low: int, high: int) -> int:
+    """Add the rows of `source` with ids in [low, high) to the rollups; return how many there were"""
+    dialect = connection.dialect.name
+    columns = source.c
+    hour, day, month = _buckets(dialect, columns.check_in_time)
+    in_range = (columns.id >= low, columns.id < high)
+    with_plan = (*in_range, columns.plan_id.is_not(None))
+
+    connection.execute(_upsert_counts(dialect, AttendanceHourly, ["hour"], (
+        select(hour, func.count()).where(*in_range).group_by(hour)
+    )))
+    connection.execute(_upsert_counts(dialect, AttendanceDaily, ["day"], (
+        select(day, func.count()).where(*in_range).group_by(day)
+    )))
+    connection.execute(_upsert_counts(dialect, AttendanceMemberMonthly, ["member_id", "month"], (
+        select(columns.member_id, month, func.count()).where(*in_range).group_by(columns.member_id, month)
+    )))
+    connection.execute(_upsert_counts(dialect, AttendancePlanHourly, ["hour", "plan_id"], (
+        select(hour, columns.plan_id, func.count()).where(*with_plan).group_by(hour, columns.plan_id)
+    )))
+    connection.execute(_upsert_counts(dialect, AttendancePlanDaily, ["day", "plan_id"], (
+        select(day, columns.plan_id, func.count()).where(*with_plan).group_by(day, columns.plan_id)
+    )))
+    return connection.scalar(select(func.count()).where(*in_range).select_from(source))
+
+
+def rebuild_rollups(engine, batch_size: int = 100000) -> int:
+    """
+    Recompute all rollups from attendance and its archive and return the
+    rows counted.
+
+    The rollups are cleared and the current max attendance id captured in
+    one transaction; rows above it are counted by the trigger, rows up to
+    it by GROUP BY batches over attendance id ranges. Archived rows are
+    counted the same way, table by table. Run it while the archive job is
+    not running: a row moved between the two mid-rebuild may be counted
+    twice or not at all.
+    """
+    with engine.begin() as connection:
+        for model in ROLLUPS:
+            connection.execute(delete(model))
+        sources = [Attendance.__table__] + all_archive_sources(connection)
+        max_ids = [connection.scalar(select(func.max(source.c.id))) or 0 for source in sources]
+
+    counted = 0
+    for source, max_id in zip(sources, max_ids):
+        for low in range(0, max_id + 1, batch_size):
+            with engine.begin() as connection:
+                counted += _count_range(connection, source, low, min(low + batch_size, max_id + 1))
+
+    return counted
+
+
+def main():
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Recompute attendance rollups from attendance and its archive")
+    parser.add_argument("--batch-size", type=int, default=100000, help="Attendance ids per transaction")
+    args = parser.parse_args()
+
+    counted = rebuild_rollups(engine, args.batch_size)
+    print(f"Rebuilt attendance rollups from {counted} check-ins")
+
+
+if __name__ == "__main__":
+    main()
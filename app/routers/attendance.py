@@ -1,63 +1,574 @@
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import datetime, date
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, date, timedelta
+from typing import Optional
 
-from app.database import get_db
-from app.models import Attendance, Member, Subscription
-from app.schemas import AttendanceCheckIn, AttendanceResponse, AttendanceListResponse
+from app.cache import subscription_windows
+from app.archive import archive_source, archived_months, hot_cutoff
+from app.database import (
+    BRANCHES, branch_scoped, dialect_name, get_db, get_read_db, get_shard, open_read_session, use_branch
+)
+from app.dedup import IdempotencyKeyConflict, scan_deduplicator
+from app.expand import parse_expand
+from app.models import (
+    Attendance, AttendanceDaily, AttendanceHourly, AttendanceMemberMonthly, AttendancePlanDaily, AttendancePlanHourly,
+    Member, Subscription
+)
+from app.occupancy import close_superseded_sessions, occupancy
+from app.pagination import encode_cursor, decode_cursor
+from app.schemas import (
+    AttendanceCheckIn, AttendanceCheckOut, AttendanceResponse, AttendanceListResponse, MemberResponse,
+    AttendanceBulkCheckIn, AttendanceBulkResponse, OccupancyResponse,
+    HourlyStatsResponse, DailyStatsResponse, MemberMonthlyStatsResponse, PlanHourlyStatsResponse,
+    PlanDailyStatsResponse, BranchHourlyStatsResponse, BranchDailyStatsResponse
+)
+from app.serialization import FastJSONResponse, dumps, object_dicts, response_columns, row_dicts
+from app.write_behind import attendance_queue, insert_attendance_rows, QueueFullError
 
 router = APIRouter()
 
+# Rows fetched per round trip when streaming history
+STREAM_BATCH_SIZE = 500
+
+# Widest windows the stats endpoints serve
+MAX_HOURLY_WINDOW = timedelta(days=31)
+MAX_DAILY_WINDOW = timedelta(days=366)
+
+# Columns selected for history pages and streams
+ATTENDANCE_COLUMNS = response_columns(Attendance, AttendanceResponse)
+MEMBER_COLUMNS = response_columns(Member, MemberResponse)
+
 @router.post("/check-in", response_model=AttendanceResponse, status_code=201)
-def check_in(check_in_data: AttendanceCheckIn, db: Session = Depends(get_db)):
+async def check_in(
+    check_in_data: AttendanceCheckIn,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, description="Replays the first result for retried requests"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Check a member in
 
-    member = db.query(Member).filter(Member.id == check_in_data.member_id).first()
-    if not member:
-        raise HTTPException(status_code=404, detail="Member not found")
+    A repeat scan inside the de-duplication window, or a retry with the same
+    `Idempotency-Key`, returns the existing record with 200 instead of 201.
+    """
+    member_id = check_in_data.member_id
+    try:
+        attendance, duplicate = await scan_deduplicator.check_in(
+            branch_scoped(member_id), idempotency_key, lambda: _check_in(db, member_id)
+        )
+    except IdempotencyKeyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for another member")
+    if duplicate:
+        response.status_code = 200
+    return attendance
 
-    today = date.today()
 
-    active_subscription = db.query(Subscription).filter(
-        Subscription.member_id == member.id,
-        Subscription.start_date <= today,
-        Subscription.end_date >= today,
-        Subscription.status == "active"
-    ).first()
+async def _check_in(db: AsyncSession, member_id: int) -> dict:
+    today = date.today()
+    windows = subscription_windows.get(branch_scoped(member_id))
+    plan_id = _admitting_plan(windows or (), today)
+    if plan_id is None:
+        # A rejection is always confirmed against the database: the
+        # subscription may have been added by another worker since
+        windows = await _load_subscription_windows(db, member_id)
+        if windows is None:
+            raise HTTPException(status_code=404, detail="Member not found")
+        if windows:
+            subscription_windows.set(branch_scoped(member_id), windows)
+        plan_id = _admitting_plan(windows, today)
 
-    if not active_subscription:
+    if plan_id is None:
         raise HTTPException(
             status_code=400,
             detail="No active subscription for this member"
         )
 
-    attendance = Attendance(
-        member_id=member.id,
-        check_in_time=datetime.utcnow()
+    if attendance_queue.running:
+        # Release the connection while waiting for the group commit
+        await db.close()
+        try:
+            # The flush closes superseded sessions and adjusts occupancy
+            attendance = await attendance_queue.submit(member_id, datetime.utcnow(), plan_id)
+        except QueueFullError:
+            raise HTTPException(
+                status_code=503,
+                detail="Check-in queue is full, retry shortly",
+                headers={"Retry-After": "1"}
+            )
+        return attendance
+
+    values = {"member_id": member_id, "check_in_time": datetime.utcnow(), "plan_id": plan_id}
+    opened = await close_superseded_sessions(db, [values])
+    result = await db.execute(
+        insert(Attendance)
+        .values(**values)
+        .returning(*Attendance.__table__.c)
     )
+    attendance = result.mappings().one()
+    await db.commit()
+    occupancy.checked_in(opened)
+
+    return attendance
 
-    db.add(attendance)
-    db.commit()
-    db.refresh(attendance)
+
+@router.post("/check-out", response_model=AttendanceResponse)
+async def check_out(check_out_data: AttendanceCheckOut, db: AsyncSession = Depends(get_db)):
+    """
+    Close the member's most recent open session
+
+    A single UPDATE ... RETURNING; the open session is the newest row of
+    the member's history, found by walking the history index backwards.
+    """
+    member_id = check_out_data.member_id
+
+    latest_open = (
+        select(Attendance.id)
+        .where(Attendance.member_id == member_id, Attendance.check_out_time.is_(None))
+        .order_by(Attendance.check_in_time.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(Attendance)
+        .where(Attendance.id == latest_open, Attendance.check_out_time.is_(None))
+        .values(check_out_time=datetime.utcnow())
+        .returning(*Attendance.__table__.c)
+        .execution_options(synchronize_session=False)
+    )
+    attendance = result.mappings().first()
+    if attendance is None:
+        if await db.get(Member, member_id) is None:
+            raise HTTPException(status_code=404, detail="Member not found")
+        raise HTTPException(status_code=400, detail="Member is not checked in")
+    await db.commit()
+    occupancy.checked_out()
+    scan_deduplicator.forget(branch_scoped(member_id))
 
     return attendance
 
 
-@router.get("/members/{member_id}/attendance", response_model=AttendanceListResponse)
-def get_member_attendance(member_id: int, db: Session = Depends(get_db)):
+@router.get("/occupancy", response_model=OccupancyResponse)
+async def get_occupancy():
+    """Members currently on the floor (open sessions), from the in-memory counter"""
+    return occupancy.stats()
+
+
+@router.post("/check-in/bulk", response_model=AttendanceBulkResponse)
+async def bulk_check_in(payload: AttendanceBulkCheckIn, db: AsyncSession = Depends(get_db)):
     """
-    Return ALL attendance records for a given member.
-    No filters. No pagination.
+    Replay a batch of buffered scans in one transaction
+
+    Members and subscriptions are validated with set-based queries; valid
+    scans are inserted with a single executemany. Each item gets its own
+    result, so one bad scan does not reject the batch.
     """
-    member = db.query(Member).filter(Member.id == member_id).first()
+    now = datetime.utcnow()
+    scans = [(item.member_id, item.check_in_time or now) for item in payload.items]
+    member_ids = {member_id for member_id, _ in scans}
+    earliest = min(scan_time for _, scan_time in scans).date()
+
+    known_members = set((await db.scalars(
+        select(Member.id).where(Member.id.in_(member_ids))
+    )).all())
+
+    # Replayed scans may predate the sweeper expiring a subscription; each
+    # is checked against the windows, so expired ones still count for the
+    # days they ran (cancelled ones do not)
+    windows = {}
+    rows = await db.execute(
+        select(Subscription.member_id, Subscription.start_date, Subscription.end_date, Subscription.plan_id).where(
+            Subscription.member_id.in_(known_members),
+            Subscription.status.in_(["active", "expired"]),
+            Subscription.end_date >= earliest
+        )
+    )
+    for member_id, start, end, plan_id in rows:
+        windows.setdefault(member_id, []).append((start, end, plan_id))
+
+    results = []
+    valid = []
+    for index, (member_id, scan_time) in enumerate(scans):
+        result = {"index": index, "member_id": member_id}
+        plan_id = _admitting_plan(windows.get(member_id, ()), scan_time.date())
+        if member_id not in known_members:
+            result.update(status="error", detail="Member not found")
+        elif plan_id is None:
+            result.update(status="error", detail="No active subscription for this member")
+        else:
+            result["status"] = "created"
+            valid.append((result, {"member_id": member_id, "check_in_time": scan_time, "plan_id": plan_id}))
+        results.append(result)
+
+    if valid:
+        opened = await close_superseded_sessions(db, [params for _, params in valid])
+        inserted = await insert_attendance_rows(db, [params for _, params in valid])
+        for (result, _), row in zip(valid, inserted):
+            result["attendance_id"] = row["id"]
+        await db.commit()
+        occupancy.checked_in(opened)
+
+    return {
+        "created": len(valid),
+        "failed": len(results) - len(valid),
+        "results": results
+    }
+
+
+@router.get("/check-in/cache-stats")
+async def get_check_in_cache_stats():
+    """Hit/miss counters of the active-subscription cache used by check-in"""
+    return subscription_windows.stats()
+
+
+@router.get("/check-in/dedup-stats")
+async def get_check_in_dedup_stats():
+    """Counters of the repeated-scan window and Idempotency-Key replays"""
+    return scan_deduplicator.stats()
+
+
+@router.get("/check-in/queue-stats")
+async def get_check_in_queue_stats():
+    """Depth and flush counters of the write-behind check-in queue"""
+    return attendance_queue.stats()
+
+
+@router.get("/stats/hourly", response_model=HourlyStatsResponse)
+async def get_hourly_stats(
+    from_time: Optional[datetime] = Query(None, alias="from", description="Window start (default: 24 hours ago)"),
+    to_time: Optional[datetime] = Query(None, alias="to", description="Window end, exclusive (default: now)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Check-ins per hour, read from the hourly rollup (up to 31 days)"""
+    to_time = to_time or datetime.utcnow()
+    from_time = from_time or to_time - timedelta(hours=24)
+    _check_stats_window(from_time, to_time, MAX_HOURLY_WINDOW)
+
+    return await _hourly_stats(db, AttendanceHourly, from_time, to_time)
+
+
+@router.get("/stats/daily", response_model=DailyStatsResponse)
+async def get_daily_stats(
+    from_date: Optional[date] = Query(None, alias="from", description="First day (default: 29 days before `to`)"),
+    to_date: Optional[date] = Query(None, alias="to", description="Last day, inclusive (default: today)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Check-ins per day, read from the daily rollup (up to 366 days)"""
+    to_date = to_date or datetime.utcnow().date()
+    from_date = from_date or to_date - timedelta(days=29)
+    _check_stats_window(from_date, to_date, MAX_DAILY_WINDOW)
+
+    return await _daily_stats(db, AttendanceDaily, from_date, to_date)
+
+
+@router.get("/stats/plans/hourly", response_model=PlanHourlyStatsResponse)
+async def get_plan_hourly_stats(
+    from_time: Optional[datetime] = Query(None, alias="from", description="Window start (default: 24 hours ago)"),
+    to_time: Optional[datetime] = Query(None, alias="to", description="Window end, exclusive (default: now)"),
+    plan_id: Optional[int] = Query(None, description="Only this plan"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Check-ins per hour per plan, read from the per-plan hourly rollup (up to 31 days)"""
+    to_time = to_time or datetime.utcnow()
+    from_time = from_time or to_time - timedelta(hours=24)
+    _check_stats_window(from_time, to_time, MAX_HOURLY_WINDOW)
+    return await _hourly_stats(db, AttendancePlanHourly, from_time, to_time, plan_id)
+
+
+@router.get("/stats/plans/daily", response_model=PlanDailyStatsResponse)
+async def get_plan_daily_stats(
+    from_date: Optional[date] = Query(None, alias="from", description="First day (default: 29 days before `to`)"),
+    to_date: Optional[date] = Query(None, alias="to", description="Last day, inclusive (default: today)"),
+    plan_id: Optional[int] = Query(None, description="Only this plan"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Check-ins per day per plan, read from the per-plan daily rollup (up to 366 days)"""
+    to_date = to_date or datetime.utcnow().date()
+    from_date = from_date or to_date - timedelta(days=29)
+    _check_stats_window(from_date, to_date, MAX_DAILY_WINDOW)
+    return await _daily_stats(db, AttendancePlanDaily, from_date, to_date, plan_id)
+
+
+@router.get("/stats/branches/hourly", response_model=BranchHourlyStatsResponse)
+async def get_branch_hourly_stats(
+    from_time: Optional[datetime] = Query(None, alias="from", description="Window start (default: 24 hours ago)"),
+    to_time: Optional[datetime] = Query(None, alias="to", description="Window end, exclusive (default: now)"),
+):
+    """
+    Check-ins per hour for every branch, read from each branch shard's
+    hourly rollup (up to 31 days)
+    """
+    to_time = to_time or datetime.utcnow()
+    from_time = from_time or to_time - timedelta(hours=24)
+    _check_stats_window(from_time, to_time, MAX_HOURLY_WINDOW)
+    return await _branch_stats(lambda db: _hourly_stats(db, AttendanceHourly, from_time, to_time))
+
+
+@router.get("/stats/branches/daily", response_model=BranchDailyStatsResponse)
+async def get_branch_daily_stats(
+    from_date: Optional[date] = Query(None, alias="from", description="First day (default: 29 days before `to`)"),
+    to_date: Optional[date] = Query(None, alias="to", description="Last day, inclusive (default: today)"),
+):
+    """
+    Check-ins per day for every branch, read from each branch shard's daily
+    rollup (up to 366 days)
+    """
+    to_date = to_date or datetime.utcnow().date()
+    from_date = from_date or to_date - timedelta(days=29)
+    _check_stats_window(from_date, to_date, MAX_DAILY_WINDOW)
+    return await _branch_stats(lambda db: _daily_stats(db, AttendanceDaily, from_date, to_date))
+
+
+@router.get("/stats/members/{member_id}/monthly", response_model=MemberMonthlyStatsResponse)
+async def get_member_monthly_stats(
+    member_id: int,
+    months: int = Query(12, ge=1, le=120, description="Number of months, ending with the current one"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """A member's check-ins per month, read from the per-member monthly rollup"""
+    member = await db.get(Member, member_id)
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
 
-    records = db.query(Attendance).filter(
-        Attendance.member_id == member_id
-    ).order_by(Attendance.check_in_time.desc()).all()
+    first = datetime.utcnow().date().replace(day=1)
+    for _ in range(months - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
 
+    rows = (await db.execute(
+        select(AttendanceMemberMonthly.month, AttendanceMemberMonthly.visits)
+        .where(AttendanceMemberMonthly.member_id == member_id, AttendanceMemberMonthly.month >= first)
+        .order_by(AttendanceMemberMonthly.month)
+    )).all()
     return {
-        "total": len(records),
-        "items": records
+        "member_id": member_id,
+        "visits": sum(visits for _, visits in rows),
+        "items": [{"month": month, "visits": visits} for month, visits in rows]
     }
+
+
+async def _hourly_stats(db: AsyncSession, model, from_time: datetime, to_time: datetime, plan_id: Optional[int] = None):
+    """Rows of an hourly rollup (`model`) in [from_time, to_time), with their total"""
+    keys = [model.hour] + ([model.plan_id] if hasattr(model, "plan_id") else [])
+    query = (
+        select(*keys, model.visits)
+        .where(model.hour >= from_time.replace(minute=0, second=0, microsecond=0), model.hour < to_time)
+        .order_by(*keys)
+    )
+    if plan_id is not None:
+        query = query.where(model.plan_id == plan_id)
+    rows = (await db.execute(query)).mappings().all()
+    return {"visits": sum(row["visits"] for row in rows), "items": rows}
+
+
+async def _daily_stats(db: AsyncSession, model, from_date: date, to_date: date, plan_id: Optional[int] = None):
+    """Rows of a daily rollup (`model`) from from_date to to_date inclusive, with their total"""
+    keys = [model.day] + ([model.plan_id] if hasattr(model, "plan_id") else [])
+    query = select(*keys, model.visits).where(model.day >= from_date, model.day <= to_date).order_by(*keys)
+    if plan_id is not None:
+        query = query.where(model.plan_id == plan_id)
+    rows = (await db.execute(query)).mappings().all()
+    return {"visits": sum(row["visits"] for row in rows), "items": rows}
+
+
+async def _branch_stats(read) -> dict:
+    """
+    Run `read(db)` against every branch shard and collect the results per
+    branch. A database shared by several branches is read once, under the
+    first of them.
+    """
+    branches = []
+    seen = []
+    for branch in BRANCHES:
+        shard = get_shard(branch)
+        if shard in seen:
+            continue
+        seen.append(shard)
+        with use_branch(branch):
+            db = open_read_session()
+            try:
+                branches.append({"branch": branch, **await read(db)})
+            finally:
+                await db.close()
+    return {"visits": sum(stats["visits"] for stats in branches), "branches": branches}
+
+
+def _check_stats_window(start, end, max_window: timedelta):
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if end - start > max_window:
+        raise HTTPException(status_code=400, detail=f"Window too large (max {max_window.days} days)")
+
+
+def _admitting_plan(windows, day: date) -> Optional[int]:
+    """Plan of the most recently started subscription window covering `day`, or None"""
+    covering = [(start, plan_id) for start, end, plan_id in windows if start <= day <= end]
+    return max(covering)[1] if covering else None
+
+
+async def _load_subscription_windows(db: AsyncSession, member_id: int):
+    """
+    Fetch the member and the (start, end, plan_id) windows of their active
+    subscriptions in one query. Returns None if the member does not exist.
+    """
+    rows = (await db.execute(
+        select(Subscription.start_date, Subscription.end_date, Subscription.plan_id)
+        .select_from(Member)
+        .outerjoin(
+            Subscription,
+            and_(
+                Subscription.member_id == Member.id,
+                Subscription.status == "active",
+                Subscription.end_date >= date.today()
+            )
+        )
+        .where(Member.id == member_id)
+    )).all()
+
+    if not rows:
+        return None
+    return tuple((start, end, plan_id) for start, end, plan_id in rows if start is not None)
+
+
+@router.get("/members/{member_id}/attendance", response_model=AttendanceListResponse)
+async def get_member_attendance(
+    member_id: int,
+    from_time: Optional[datetime] = Query(None, alias="from", description="Only check-ins at or after this time"),
+    to_time: Optional[datetime] = Query(None, alias="to", description="Only check-ins before this time"),
+    limit: int = Query(100, ge=1, le=1000, description="Page size"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page"),
+    include_total: bool = Query(False, description="Also return the total match count"),
+    format: str = Query("json", description="Response format (json/ndjson)"),
+    expand: Optional[str] = Query(None, description="Comma-separated nested objects to include (member)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Get attendance records for a member, newest first
+    
+    - **from** / **to**: Restrict to a check-in time window
+    - **limit** / **cursor**: Keyset pagination on (check_in_time, id)
+    - **format**: `ndjson` streams the whole window, one record per line
+    - **expand**: `member` nests the member object in JSON pages
+    """
+    if format not in ['json', 'ndjson']:
+        raise HTTPException(status_code=400, detail="Invalid format value")
+    expanded = parse_expand(expand, ["member"])
+
+    member = await db.get(Member, member_id)
+    if not member:
+        raise HTTPException(status_code=404, detail="Member not found")
+
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_attendance(member_id, from_time, to_time),
+            media_type="application/x-ndjson"
+        )
+
+    last = None
+    if cursor:
+        last_time, last_id = decode_cursor(cursor, 2)
+        try:
+            last_time = datetime.fromisoformat(last_time)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if not isinstance(last_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        last = (last_time, last_id)
+
+    hot = Attendance.__table__
+    records = (await db.execute(
+        _newest_first(hot, _attendance_window(hot, member_id, from_time, to_time, last)).limit(limit + 1)
+    )).all()
+
+    # Archived rows are all older than the hot cutoff: only look there if
+    # the window reaches below it and the hot rows did not fill the page
+    # with newer ones
+    cutoff = hot_cutoff()
+    window_in_archive = from_time is None or from_time < cutoff
+    if len(records) > limit:
+        page_in_archive = records[-1].check_in_time < cutoff
+    else:
+        page_in_archive = window_in_archive
+
+    archive = None
+    if window_in_archive and (page_in_archive or include_total):
+        archive = archive_source(dialect_name(), await archived_months(db, from_time, to_time))
+
+    if archive is not None and page_in_archive:
+        archived = (await db.execute(
+            _newest_first(archive, _attendance_window(archive, member_id, from_time, to_time, last)).limit(limit + 1)
+        )).all()
+        records = sorted(records + archived, key=lambda row: (row.check_in_time, row.id), reverse=True)[:limit + 1]
+
+    total = None
+    if include_total:
+        total = 0
+        for source in (hot, archive):
+            if source is not None:
+                window = _attendance_window(source, member_id, from_time, to_time)
+                total += await db.scalar(select(func.count()).select_from(window.subquery()))
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1].check_in_time, records[-1].id)
+
+    nested_member = object_dicts([member], MEMBER_COLUMNS)[0] if "member" in expanded else None
+    return FastJSONResponse({
+        "total": total,
+        "items": row_dicts(records, ATTENDANCE_COLUMNS, member=nested_member),
+        "next_cursor": next_cursor
+    })
+
+
+def _attendance_window(
+    source,
+    member_id: int,
+    from_time: Optional[datetime],
+    to_time: Optional[datetime],
+    before: Optional[tuple] = None
+):
+    """
+    Select a member's check-ins in an optional time window from `source`
+    (the attendance table or archive storage), optionally only those
+    before a (check_in_time, id) keyset position
+    """
+    columns = source.c
+    query = select(*(columns[column.key] for column in ATTENDANCE_COLUMNS)).where(columns.member_id == member_id)
+    if from_time is not None:
+        query = query.where(columns.check_in_time >= from_time)
+    if to_time is not None:
+        query = query.where(columns.check_in_time < to_time)
+    if before is not None:
+        query = query.where(tuple_(columns.check_in_time, columns.id) < tuple_(*before))
+    return query
+
+
+def _newest_first(source, query):
+    return query.order_by(source.c.check_in_time.desc(), source.c.id.desc())
+
+
+async def _stream_attendance(member_id: int, from_time: Optional[datetime], to_time: Optional[datetime]):
+    """
+    Yield attendance records as NDJSON lines: hot rows, then archived ones.
+
+    Uses its own session so the cursor outlives the request dependency.
+    """
+    db = open_read_session()
+    try:
+        sources = [Attendance.__table__]
+        if from_time is None or from_time < hot_cutoff():
+            archive = archive_source(dialect_name(), await archived_months(db, from_time, to_time))
+            if archive is not None:
+                sources.append(archive)
+
+        for source in sources:
+            query = _newest_first(
+                source, _attendance_window(source, member_id, from_time, to_time)
+            ).execution_options(yield_per=STREAM_BATCH_SIZE)
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                yield b"".join(dumps(record) + b"\n" for record in row_dicts(rows, ATTENDANCE_COLUMNS))
+    finally:
+        await db.close()
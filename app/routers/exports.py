@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import Optional
+
+from app.database import open_read_session
+from app.export import FORMATS, export_rows, gzip_chunks, watermark
+
+router = APIRouter()
+
+
+async def _stream_export(name: str, format: str, since: Optional[datetime], until: datetime, compress: bool):
+    """Stream an export from its own session, so the cursor outlives the request dependency"""
+    db = open_read_session()
+    try:
+        chunks = export_rows(db, name, format, since, until)
+        if compress:
+            chunks = gzip_chunks(chunks)
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await db.close()
+
+
+def _export_response(name: str, format: str, since: Optional[datetime], compress: bool) -> StreamingResponse:
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format value")
+    until = watermark()
+    filename = f"{name}.{format}" + (".gz" if compress else "")
+    return StreamingResponse(
+        _stream_export(name, format, since, until, compress),
+        media_type="application/gzip" if compress else FORMATS[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Export-Watermark": until.isoformat(),
+        }
+    )
+
+
+@router.get("/attendance")
+async def export_attendance(
+    format: str = Query("csv", description="Output format (csv/ndjson)"),
+    since: Optional[datetime] = Query(None, description="Watermark of the previous export; omit for a full dump"),
+    gzip: bool = Query(False, description="Gzip-compress the output"),
+):
+    """
+    Stream all check-ins, hot and archived
+
+    With `since`, only check-ins created after it (up to the watermark
+    returned in `X-Export-Watermark`) are included.
+    """
+    return _export_response("attendance", format, since, gzip)
+
+
+@router.get("/subscriptions")
+async def export_subscriptions(
+    format: str = Query("csv", description="Output format (csv/ndjson)"),
+    since: Optional[datetime] = Query(None, description="Watermark of the previous export; omit for a full dump"),
+    gzip: bool = Query(False, description="Gzip-compress the output"),
+):
+    """
+    Stream all subscriptions
+
+    With `since`, only subscriptions created or changed after it (up to the
+    watermark returned in `X-Export-Watermark`) are included.
+    """
+    return _export_response("subscriptions", format, since, gzip)
@@ -1,23 +1,45 @@
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+import csv
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import ValidationError
+from sqlalchemy import delete, select, func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from datetime import date, datetime
 
-from app.database import get_db
+from app.cache import subscription_windows
+from app.database import SHARDING_ENABLED, branch_scoped, get_db, get_read_db
+from app.directory import find_member, lookup_phone, register_members, registered_phones
 from app.models import Member
-from app.schemas import MemberCreate, MemberUpdate, MemberResponse, MemberListResponse
+from app.pagination import encode_cursor, decode_cursor
+from app.search import (
+    is_phone_prefix, member_search_clause, phone_prefix_clause, ranked_member_search, search_dialect
+)
+from app.serialization import FastJSONResponse, response_columns, row_dicts
+from app.schemas import (
+    MemberCreate, MemberUpdate, MemberResponse, MemberListResponse, MemberImportResponse, MemberLookupResponse
+)
 
 router = APIRouter()
 
+# Rows validated, de-duplicated and inserted per transaction during import
+IMPORT_BATCH_SIZE = 1000
+
+# Cap on per-row errors echoed back from an import
+MAX_IMPORT_ERRORS = 1000
+
+# Columns selected for list pages (serialized without building ORM objects)
+MEMBER_COLUMNS = response_columns(Member, MemberResponse)
+
 
 @router.post("/", response_model=MemberResponse, status_code=201)
-def create_member(member: MemberCreate, db: Session = Depends(get_db)):
+async def create_member(member: MemberCreate, db: AsyncSession = Depends(get_db)):
 
     # Check if phone already exists
-    existing_member = db.query(Member).filter(Member.phone == member.phone).first()
-    if existing_member:
+    existing_member = await db.scalar(select(Member).where(Member.phone == member.phone))
+    if existing_member or (SHARDING_ENABLED and await lookup_phone(member.phone) is not None):
         raise HTTPException(status_code=400, detail="Phone number already registered")
     
     # Create new member
@@ -29,60 +51,311 @@ def create_member(member: MemberCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_member)
-    db.commit()
-    db.refresh(db_member)
+    await db.commit()
+    await db.refresh(db_member)
+
+    if SHARDING_ENABLED:
+        try:
+            await register_members([(db_member.phone, db_member.id)])
+        except IntegrityError:
+            # Another branch claimed the phone in the meantime
+            await db.delete(db_member)
+            await db.commit()
+            raise HTTPException(status_code=400, detail="Phone number already registered")
     
     return db_member
 
 
+@router.post("/import", response_model=MemberImportResponse)
+async def import_members(
+    request: Request,
+    format: Optional[str] = Query(None, description="Body format (csv/ndjson); defaults from Content-Type"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Bulk-import members from a streamed CSV or NDJSON body
+
+    - **csv**: header row with `name`, `phone` and optional `status`, `join_date`
+    - **ndjson**: one JSON object per line with the same fields
+
+    Rows are validated with `MemberCreate`, checked for duplicate phones in
+    batches and inserted one transaction per batch. Invalid rows are
+    reported and skipped.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "ndjson"
+    if format not in ['csv', 'ndjson']:
+        raise HTTPException(status_code=400, detail="Invalid format value")
+
+    summary = {"imported": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    seen_phones = set()
+    batch = []
+
+    async for row, record in _parse_member_rows(request, format):
+        if isinstance(record, str):
+            _record_import_error(summary, row, record)
+            continue
+        try:
+            member = MemberCreate(**record)
+        except (ValidationError, TypeError) as exc:
+            _record_import_error(summary, row, _validation_message(exc))
+            continue
+        if member.phone in seen_phones:
+            _record_import_error(summary, row, "Duplicate phone number in import")
+            continue
+        seen_phones.add(member.phone)
+        batch.append((row, member))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await _insert_member_batch(db, batch, summary)
+            batch = []
+
+    if batch:
+        await _insert_member_batch(db, batch, summary)
+
+    return summary
+
+
+async def _iter_body_lines(request: Request):
+    """Yield decoded lines of the request body as it arrives"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+async def _parse_member_rows(request: Request, format: str):
+    """
+    Yield (row number, record dict) for each non-blank line, or
+    (row number, error message) when a line cannot be parsed
+    """
+    header = None
+    row = 0
+    async for line in _iter_body_lines(request):
+        if not line.strip():
+            continue
+        if format == "csv" and header is None:
+            header = [name.strip() for name in next(csv.reader([line]))]
+            continue
+
+        row += 1
+        if format == "csv":
+            values = next(csv.reader([line]))
+            if len(values) != len(header):
+                yield row, "Wrong number of columns"
+                continue
+            # Blank optional cells fall back to schema defaults
+            yield row, {key: value for key, value in zip(header, values) if value != ""}
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield row, "Invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield row, "Expected a JSON object"
+                continue
+            yield row, record
+
+
+async def _insert_member_batch(db: AsyncSession, batch, summary: dict):
+    """Skip phones that already exist, then insert the rest in one transaction"""
+    phones = [member.phone for _, member in batch]
+    existing = set((await db.scalars(select(Member.phone).where(Member.phone.in_(phones)))).all())
+    if SHARDING_ENABLED:
+        existing |= await registered_phones(phones)
+
+    rows = []
+    for row, member in batch:
+        if member.phone in existing:
+            _record_import_error(summary, row, "Phone number already registered")
+        else:
+            rows.append((row, member))
+
+    if not rows:
+        return
+
+    try:
+        await db.execute(insert(Member), [_member_values(member) for _, member in rows])
+        await db.commit()
+        inserted = rows
+    except IntegrityError:
+        # A concurrent insert claimed one of the phones; retry row by row
+        await db.rollback()
+        inserted = []
+        for row, member in rows:
+            try:
+                await db.execute(insert(Member), [_member_values(member)])
+                await db.commit()
+                inserted.append((row, member))
+            except IntegrityError:
+                await db.rollback()
+                _record_import_error(summary, row, "Phone number already registered")
+
+    if SHARDING_ENABLED and inserted:
+        inserted = await _register_imported(db, inserted, summary)
+    summary["imported"] += len(inserted)
+
+
+async def _register_imported(db: AsyncSession, rows, summary: dict) -> list:
+    """Add imported members to the directory; drop those another branch claimed meanwhile"""
+    ids = dict((await db.execute(
+        select(Member.phone, Member.id).where(Member.phone.in_([member.phone for _, member in rows]))
+    )).all())
+    try:
+        await register_members([(member.phone, ids[member.phone]) for _, member in rows])
+        return rows
+    except IntegrityError:
+        pass
+
+    registered = []
+    for row, member in rows:
+        try:
+            await register_members([(member.phone, ids[member.phone])])
+            registered.append((row, member))
+        except IntegrityError:
+            await db.execute(delete(Member).where(Member.id == ids[member.phone]))
+            await db.commit()
+            _record_import_error(summary, row, "Phone number already registered")
+    return registered
+
+
+def _member_values(member: MemberCreate) -> dict:
+    return {
+        "name": member.name,
+        "phone": member.phone,
+        "status": member.status,
+        "join_date": member.join_date or date.today()
+    }
+
+
+def _record_import_error(summary: dict, row: int, detail: str):
+    summary["failed"] += 1
+    if len(summary["errors"]) < MAX_IMPORT_ERRORS:
+        summary["errors"].append({"row": row, "detail": detail})
+    else:
+        summary["errors_truncated"] = True
+
+
+def _validation_message(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" if error['loc'] else error['msg']
+            for error in exc.errors()
+        )
+    return str(exc)
+
+
 @router.get("/", response_model=MemberListResponse)
-def get_members(
+async def get_members(
     status: Optional[str] = Query(None, description="Filter by status (active/inactive/suspended)"),
     search: Optional[str] = Query(None, description="Search by name or phone"),
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=500, description="Page size"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page"),
+    include_total: bool = Query(False, description="Also return the total match count"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Get list of all members with optional filtering
+    Get a page of members with optional filtering
     
     - **status**: Filter by member status
     - **search**: Search members by name or phone
+    - **limit**: Maximum number of members to return
+    - **cursor**: `next_cursor` from the previous page
+    - **include_total**: Run a COUNT over the filtered set (slow on large tables)
     """
-    query = db.query(Member)
+    query = select(*MEMBER_COLUMNS)
     
     # Apply status filter
     if status:
         if status not in ['active', 'inactive', 'suspended']:
             raise HTTPException(status_code=400, detail="Invalid status value")
-        query = query.filter(Member.status == status)
+        query = query.where(Member.status == status)
     
-    # Apply search filter
+    # Apply search filter (served by the member search index)
     if search:
-        search_pattern = f"%{search}%"
-        query = query.filter(
-            or_(
-                Member.name.ilike(search_pattern),
-                Member.phone.ilike(search_pattern)
-            )
-        )
+        query = query.where(member_search_clause(search_dialect(), search))
+
+    # Total count is opt-in
+    total = None
+    if include_total:
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
 
-    # Total count
-    total = query.count()
+    # Keyset pagination on the primary key
+    if cursor:
+        (last_id,) = decode_cursor(cursor, 1)
+        if not isinstance(last_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(Member.id > last_id)
 
-    # Fetch ALL results (no pagination)
-    members = query.all()
+    rows = (await db.execute(query.order_by(Member.id).limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
     
-    return {
+    return FastJSONResponse({
         "total": total,
-        "items": members
-    }
+        "items": row_dicts(rows, MEMBER_COLUMNS),
+        "next_cursor": next_cursor
+    })
+
+
+@router.get("/search", response_model=MemberListResponse)
+async def search_members(
+    q: str = Query(..., min_length=1, max_length=100, description="Name or phone fragment"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of matches"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Ranked member search for type-ahead boxes
+
+    Digit-only queries return phone-prefix matches first (an index range
+    scan), then other phone/name matches ranked by the search index.
+    """
+    q = q.strip()
+    dialect = search_dialect()
+    members = []
+
+    if is_phone_prefix(q):
+        members = list((await db.scalars(
+            select(Member).where(phone_prefix_clause(q)).order_by(Member.phone).limit(limit)
+        )).all())
+
+    if len(members) < limit:
+        seen = {member.id for member in members}
+        ranked = await ranked_member_search(db, dialect, q, limit)
+        members.extend(member for member in ranked if member.id not in seen)
+
+    return {"items": members[:limit]}
+
+
+@router.get("/by-phone/{phone}", response_model=MemberLookupResponse)
+async def get_member_by_phone(phone: str):
+    """
+    Find a member by phone in any branch
+
+    With sharding, the member directory names the member's branch and only
+    that branch's database is read; otherwise this is a plain phone lookup.
+    """
+    found = await find_member(phone)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Member not found")
+    branch, member = found
+    return {"branch": branch, "member": member}
 
 
 @router.get("/{member_id}", response_model=MemberResponse)
-def get_member(member_id: int, db: Session = Depends(get_db)):
+async def get_member(member_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     Get a specific member by ID
     """
-    member = db.query(Member).filter(Member.id == member_id).first()
+    member = await db.get(Member, member_id)
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     return member
@@ -92,11 +365,11 @@ def get_member(member_id: int, db: Session = Depends(get_db)):
 
 
 @router.delete("/{member_id}", status_code=204)
-def delete_member(member_id: int, db: Session = Depends(get_db)):
+async def delete_member(member_id: int, db: AsyncSession = Depends(get_db)):
     """
     Delete a member (soft delete by setting status to inactive)
     """
-    member = db.query(Member).filter(Member.id == member_id).first()
+    member = await db.get(Member, member_id)
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
@@ -104,6 +377,7 @@ def delete_member(member_id: int, db: Session = Depends(get_db)):
     member.status = "inactive"
     member.updated_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
+    subscription_windows.invalidate(branch_scoped(member_id))
     
     return None
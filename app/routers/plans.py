@@ -1,20 +1,25 @@
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from datetime import datetime
 
+from app.cache import plan_catalog
 from app.database import get_db
 from app.models import Plan
 from app.schemas import PlanCreate, PlanUpdate, PlanResponse, PlanListResponse
+from app.serialization import FastJSONResponse, object_dicts, response_columns
 
 router = APIRouter()
 
+PLAN_COLUMNS = response_columns(Plan, PlanResponse)
+
 
 @router.post("/", response_model=PlanResponse, status_code=201)
-def create_plan(plan: PlanCreate, db: Session = Depends(get_db)):
+async def create_plan(plan: PlanCreate, db: AsyncSession = Depends(get_db)):
     """Create a new subscription plan"""
-    existing_plan = db.query(Plan).filter(Plan.name == plan.name).first()
+    existing_plan = await db.scalar(select(Plan).where(Plan.name == plan.name))
     if existing_plan:
         raise HTTPException(status_code=400, detail="Plan name already exists")
     
@@ -25,54 +30,62 @@ def create_plan(plan: PlanCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_plan)
-    db.commit()
-    db.refresh(db_plan)
+    await db.commit()
+    await db.refresh(db_plan)
+    plan_catalog.invalidate()
     
     return db_plan
 
 
 @router.get("/", response_model=PlanListResponse)
-def get_plans(
+async def get_plans(
+    request: Request,
     is_active: Optional[bool] = Query(None),
     min_price: Optional[float] = Query(None, ge=0),
-    max_price: Optional[float] = Query(None, ge=0),
-    db: Session = Depends(get_db)
+    max_price: Optional[float] = Query(None, ge=0)
 ):
-    """Get list of all plans with optional filtering"""
+    """Get list of all plans with optional filtering (served from the plan catalog)"""
+    etag = await plan_catalog.etag()
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
     
-    query = db.query(Plan)
+    plans = await plan_catalog.all()
     
     if is_active is not None:
-        query = query.filter(Plan.is_active == ("active" if is_active else "inactive"))
+        status = "active" if is_active else "inactive"
+        plans = [plan for plan in plans if plan.is_active == status]
     
     if min_price is not None:
-        query = query.filter(Plan.price >= min_price)
+        plans = [plan for plan in plans if plan.price >= min_price]
     
     if max_price is not None:
-        query = query.filter(Plan.price <= max_price)
-    
-    total = query.count()
-    plans = query.all()
+        plans = [plan for plan in plans if plan.price <= max_price]
     
-    return {"total": total, "items": plans}
+    response = FastJSONResponse({"total": len(plans), "items": object_dicts(plans, PLAN_COLUMNS)})
+    _set_validators(response, etag)
+    return response
 
 
 @router.get("/{plan_id}", response_model=PlanResponse)
-def get_plan(plan_id: int, db: Session = Depends(get_db)):
-    plan = db.query(Plan).filter(Plan.id == plan_id).first()
+async def get_plan(plan_id: int, request: Request, response: Response):
+    plan = await plan_catalog.get(plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
+    etag = await plan_catalog.etag()
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    _set_validators(response, etag)
     return plan
 
 
 @router.put("/{plan_id}", response_model=PlanResponse)
-def update_plan(plan_id: int, plan_update: PlanUpdate, db: Session = Depends(get_db)):
-    plan = db.query(Plan).filter(Plan.id == plan_id).first()
+async def update_plan(plan_id: int, plan_update: PlanUpdate, db: AsyncSession = Depends(get_db)):
+    plan = await db.get(Plan, plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
     
     if plan_update.name and plan_update.name != plan.name:
-        existing = db.query(Plan).filter(Plan.name == plan_update.name).first()
+        existing = await db.scalar(select(Plan).where(Plan.name == plan_update.name))
         if existing:
             raise HTTPException(status_code=400, detail="Plan name already exists")
     
@@ -81,19 +94,39 @@ def update_plan(plan_id: int, plan_update: PlanUpdate, db: Session = Depends(get
         setattr(plan, field, value)
     
     plan.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(plan)
+    await db.commit()
+    await db.refresh(plan)
+    plan_catalog.invalidate()
     
     return plan
 
 
 @router.delete("/{plan_id}", status_code=204)
-def delete_plan(plan_id: int, db: Session = Depends(get_db)):
-    plan = db.query(Plan).filter(Plan.id == plan_id).first()
+async def delete_plan(plan_id: int, db: AsyncSession = Depends(get_db)):
+    plan = await db.get(Plan, plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
     
     plan.is_active = "inactive"
     plan.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    plan_catalog.invalidate()
     return None
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match already names this representation"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _set_validators(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
@@ -1,26 +1,51 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date, timedelta, datetime
 from typing import Optional
 
-from app.database import get_db
-from app.models import Subscription, Member, Plan
-from app.schemas import SubscriptionCreate, SubscriptionResponse
+from app.cache import plan_catalog, subscription_windows
+from app.database import branch_scoped, get_db, get_read_db
+from app.expand import expanded_dicts, parse_expand, relationship_options
+from app.models import Member, Plan, Subscription
+from app.schemas import MemberResponse, PlanResponse, SubscriptionCreate, SubscriptionResponse
+from app.serialization import response_columns
+from app.sweeper import subscription_sweeper
 
 router = APIRouter()
 
+EXPAND_DESCRIPTION = "Comma-separated nested objects to include (member, plan)"
+
+
+SUBSCRIPTION_COLUMNS = response_columns(Subscription, SubscriptionResponse)
+NESTED_COLUMNS = {
+    "member": response_columns(Member, MemberResponse),
+    "plan": response_columns(Plan, PlanResponse),
+}
+
+
+def _subscription_options(names: set) -> list:
+    return relationship_options(
+        {"member": Subscription.member, "plan": Subscription.plan},
+        names
+    )
+
+
+def _subscription_dicts(subscriptions, names: set) -> list:
+    return expanded_dicts(subscriptions, SUBSCRIPTION_COLUMNS, NESTED_COLUMNS, names)
+
 
 @router.post("/", response_model=SubscriptionResponse, status_code=201)
-def create_subscription(subscription: SubscriptionCreate, db: Session = Depends(get_db)):
+async def create_subscription(subscription: SubscriptionCreate, db: AsyncSession = Depends(get_db)):
 
     # Validate member exists
-    member = db.query(Member).filter(Member.id == subscription.member_id).first()
+    member = await db.get(Member, subscription.member_id)
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
-    # Validate plan exists
-    plan = db.query(Plan).filter(Plan.id == subscription.plan_id).first()
+    # Validate plan exists (from the in-memory plan catalog)
+    plan = await plan_catalog.get(subscription.plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
     
@@ -31,33 +56,42 @@ def create_subscription(subscription: SubscriptionCreate, db: Session = Depends(
     # Calculate end date
     end_date = subscription.start_date + timedelta(days=plan.duration_days)
     
+    # Backdated subscriptions that already ended are born expired rather
+    # than waiting for the next expiry sweep
+    status = "expired" if end_date < date.today() else "active"
+    
     # Create subscription
     db_subscription = Subscription(
-        member_id=subscription.member_id,
-        plan_id=subscription.plan_id,
+        member_id=member.id,
+        plan_id=plan.id,
         start_date=subscription.start_date,
         end_date=end_date,
-        status="active"
+        status=status
     )
     
     db.add(db_subscription)
     
     # Update member status to active if creating new subscription
-    if member.status != "active":
+    if status == "active" and member.status != "active":
         member.status = "active"
         member.updated_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(db_subscription)
+    await db.commit()
+    subscription_windows.invalidate(branch_scoped(member.id))
     
-    return db_subscription
+    return _subscription_dicts([db_subscription], set())[0]
 
 
 @router.get("/members/{member_id}/current-subscription", response_model=SubscriptionResponse)
-def get_current_subscription(member_id: int, db: Session = Depends(get_db)):
+async def get_current_subscription(
+    member_id: int,
+    expand: Optional[str] = Query(None, description=EXPAND_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
+):
+    names = parse_expand(expand, ["member", "plan"])
 
     # Validate member exists
-    member = db.query(Member).filter(Member.id == member_id).first()
+    member = await db.get(Member, member_id)
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
@@ -65,12 +99,14 @@ def get_current_subscription(member_id: int, db: Session = Depends(get_db)):
     today = date.today()
     
     # Find active subscription
-    subscription = db.query(Subscription).filter(
-        Subscription.member_id == member_id,
-        Subscription.start_date <= today,
-        Subscription.end_date >= today,
-        Subscription.status == "active"
-    ).first()
+    subscription = await db.scalar(
+        select(Subscription).where(
+            Subscription.member_id == member_id,
+            Subscription.start_date <= today,
+            Subscription.end_date >= today,
+            Subscription.status == "active"
+        ).options(*_subscription_options(names)).limit(1)
+    )
     
     if not subscription:
         raise HTTPException(
@@ -78,37 +114,59 @@ def get_current_subscription(member_id: int, db: Session = Depends(get_db)):
             detail="No active subscription found for this member"
         )
     
-    return subscription
+    return _subscription_dicts([subscription], names)[0]
 
 
 @router.get("/", response_model=list[SubscriptionResponse])
-def get_all_subscriptions(
+async def get_all_subscriptions(
     status: Optional[str] = Query(None, description="Filter by status"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    expand: Optional[str] = Query(None, description=EXPAND_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get all subscriptions with optional filtering
+    
+    Nested `member` / `plan` objects are only included when named in
+    `expand`; each costs one extra batched query per page.
     """
-    query = db.query(Subscription)
+    names = parse_expand(expand, ["member", "plan"])
+    query = select(Subscription).options(*_subscription_options(names))
     
     if status:
         if status not in ['active', 'expired', 'cancelled']:
             raise HTTPException(status_code=400, detail="Invalid status value")
-        query = query.filter(Subscription.status == status)
+        query = query.where(Subscription.status == status)
     
-    subscriptions = query.order_by(Subscription.created_at.desc()).offset(skip).limit(limit).all()
+    subscriptions = (await db.scalars(
+        query.order_by(Subscription.created_at.desc()).offset(skip).limit(limit)
+    )).all()
     
-    return subscriptions
+    return _subscription_dicts(subscriptions, names)
+
+
+@router.get("/expiry-sweeper")
+async def get_expiry_sweeper_stats():
+    """Run counters of the background subscription expiry sweeper"""
+    return subscription_sweeper.stats()
 
 
 @router.put("/{subscription_id}/cancel", response_model=SubscriptionResponse)
-def cancel_subscription(subscription_id: int, db: Session = Depends(get_db)):
+async def cancel_subscription(
+    subscription_id: int,
+    expand: Optional[str] = Query(None, description=EXPAND_DESCRIPTION),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Cancel a subscription
     """
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    names = parse_expand(expand, ["member", "plan"])
+    subscription = await db.get(
+        Subscription,
+        subscription_id,
+        options=_subscription_options(names)
+    )
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
     
@@ -118,7 +176,7 @@ def cancel_subscription(subscription_id: int, db: Session = Depends(get_db)):
     subscription.status = "cancelled"
     subscription.updated_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(subscription)
+    await db.commit()
+    subscription_windows.invalidate(branch_scoped(subscription.member_id))
     
-    return subscription
\ No newline at end of file
+    return _subscription_dicts([subscription], names)[0]
\ No newline at end of file
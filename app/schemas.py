@@ -2,7 +2,7 @@
 Pydantic models for request/response validation
 """
 from pydantic import BaseModel, Field, field_validator
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 from typing import Optional, List
 from decimal import Decimal
 
@@ -123,6 +123,55 @@ class AttendanceCheckIn(BaseModel):
     member_id: int = Field(..., gt=0, description="Member ID")
 
 
+class AttendanceCheckOut(BaseModel):
+    """Schema for check-out request"""
+    member_id: int = Field(..., gt=0, description="Member ID")
+
+
+class OccupancyResponse(BaseModel):
+    """Schema for live floor occupancy"""
+    current: int
+    total: int
+    rebuilt_at: Optional[datetime] = None
+    auto_close: bool
+    stale_after_hours: float
+    auto_closed: int
+
+
+class AttendanceBulkItem(BaseModel):
+    """Schema for one buffered scan in a bulk check-in"""
+    member_id: int = Field(..., gt=0, description="Member ID")
+    check_in_time: Optional[datetime] = Field(None, description="Scan time (defaults to now)")
+
+    @field_validator('check_in_time')
+    @classmethod
+    def to_naive_utc(cls, v):
+        if v is not None and v.tzinfo is not None:
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        return v
+
+
+class AttendanceBulkCheckIn(BaseModel):
+    """Schema for bulk check-in request"""
+    items: List[AttendanceBulkItem] = Field(..., min_length=1, max_length=1000)
+
+
+class AttendanceBulkResult(BaseModel):
+    """Outcome of one item in a bulk check-in"""
+    index: int
+    member_id: int
+    status: str
+    attendance_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class AttendanceBulkResponse(BaseModel):
+    """Schema for bulk check-in response"""
+    created: int
+    failed: int
+    results: List[AttendanceBulkResult]
+
+
 class AttendanceResponse(BaseModel):
     """Schema for attendance response"""
     id: int
@@ -131,6 +180,7 @@ class AttendanceResponse(BaseModel):
     check_out_time: Optional[datetime]
     notes: Optional[str]
     created_at: datetime
+    plan_id: Optional[int] = None
     
     # Nested member info
     member: Optional[MemberResponse] = None
@@ -149,8 +199,29 @@ class ErrorResponse(BaseModel):
 # ========== List Response Schemas ==========
 class MemberListResponse(BaseModel):
     """Schema for paginated member list"""
-    total: int
+    total: Optional[int] = None
     items: List[MemberResponse]
+    next_cursor: Optional[str] = None
+
+
+class MemberImportError(BaseModel):
+    """A rejected row in a member import"""
+    row: int
+    detail: str
+
+
+class MemberImportResponse(BaseModel):
+    """Schema for bulk member import summary"""
+    imported: int
+    failed: int
+    errors: List[MemberImportError]
+    errors_truncated: bool = False
+
+
+class MemberLookupResponse(BaseModel):
+    """A member found by phone, with the branch that holds it"""
+    branch: str
+    member: MemberResponse
 
 
 class PlanListResponse(BaseModel):
@@ -161,5 +232,80 @@ class PlanListResponse(BaseModel):
 
 class AttendanceListResponse(BaseModel):
     """Schema for paginated attendance list"""
-    total: int
-    items: List[AttendanceResponse]
\ No newline at end of file
+    total: Optional[int] = None
+    items: List[AttendanceResponse]
+    next_cursor: Optional[str] = None
+
+# ========== Attendance Stats Schemas ==========
+class HourlyVisits(BaseModel):
+    hour: datetime
+    visits: int
+
+
+class DailyVisits(BaseModel):
+    day: date
+    visits: int
+
+
+class MonthlyVisits(BaseModel):
+    month: date
+    visits: int
+
+
+class HourlyStatsResponse(BaseModel):
+    """Check-ins per hour over a window (hours without visits are omitted)"""
+    visits: int
+    items: List[HourlyVisits]
+
+
+class DailyStatsResponse(BaseModel):
+    """Check-ins per day over a window (days without visits are omitted)"""
+    visits: int
+    items: List[DailyVisits]
+
+
+class PlanHourlyVisits(HourlyVisits):
+    plan_id: int
+
+
+class PlanDailyVisits(DailyVisits):
+    plan_id: int
+
+
+class PlanHourlyStatsResponse(BaseModel):
+    """Check-ins per hour per plan over a window"""
+    visits: int
+    items: List[PlanHourlyVisits]
+
+
+class PlanDailyStatsResponse(BaseModel):
+    """Check-ins per day per plan over a window"""
+    visits: int
+    items: List[PlanDailyVisits]
+
+
+class BranchHourlyStats(HourlyStatsResponse):
+    branch: str
+
+
+class BranchDailyStats(DailyStatsResponse):
+    branch: str
+
+
+class BranchHourlyStatsResponse(BaseModel):
+    """Check-ins per hour over a window, for every branch"""
+    visits: int
+    branches: List[BranchHourlyStats]
+
+
+class BranchDailyStatsResponse(BaseModel):
+    """Check-ins per day over a window, for every branch"""
+    visits: int
+    branches: List[BranchDailyStats]
+
+
+class MemberMonthlyStatsResponse(BaseModel):
+    """A member's check-ins per month"""
+    member_id: int
+    visits: int
+    items: List[MonthlyVisits]
@@ -0,0 +1,163 @@
+"""
+Indexed member search
+
+SQLite keeps an FTS5 trigram index (members_fts) in sync with members via
+triggers; PostgreSQL uses pg_trgm GIN indexes on name and phone. Both serve
+substring matches of 3+ characters without scanning the table. Phone
+prefixes are looked up as a range on the unique phone index.
+
+The trigram tokenizer needs SQLite 3.34+; on older builds no index is
+created and search falls back to LIKE scans.
+"""
+import logging
+import re
+from typing import Optional
+
+from sqlalchemy import and_, func, literal_column, or_, select, text
+from sqlalchemy.exc import OperationalError
+
+from app.database import dialect_name, get_shard
+from app.models import Member
+
+logger = logging.getLogger(__name__)
+
+# Trigram indexes cannot serve shorter substrings
+MIN_INDEXED_LENGTH = 3
+
+PHONE_PATTERN = re.compile(r"^\+?[0-9]+$")
+
+SQLITE_SEARCH_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS members_fts_ai AFTER INSERT ON members BEGIN
+        INSERT INTO members_fts(rowid, name, phone) VALUES (new.id, new.name, new.phone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS members_fts_ad AFTER DELETE ON members BEGIN
+        INSERT INTO members_fts(members_fts, rowid, name, phone) VALUES ('delete', old.id, old.name, old.phone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS members_fts_au AFTER UPDATE OF name, phone ON members BEGIN
+        INSERT INTO members_fts(members_fts, rowid, name, phone) VALUES ('delete', old.id, old.name, old.phone);
+        INSERT INTO members_fts(rowid, name, phone) VALUES (new.id, new.name, new.phone);
+    END
+    """,
+]
+
+# Engines whose SQLite cannot build the FTS5 trigram index
+_unindexed_engines = set()
+
+POSTGRES_SEARCH_DDL = [
+    # Once per database, in public: every schema shard's search_path ends
+    # there, while the first shard's own schema is not on the others'
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public",
+    "CREATE INDEX IF NOT EXISTS ix_members_name_trgm ON members USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_members_phone_trgm ON members USING gin (phone gin_trgm_ops)",
+]
+
+
+def install_member_search_index(connection) -> bool:
+    """
+    Create the search index for the connection's dialect, backfilling it
+    the first time. Returns False for dialects without one.
+    """
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'members_fts'")
+        ).first()
+        if not exists:
+            try:
+                connection.execute(text(
+                    "CREATE VIRTUAL TABLE members_fts USING fts5("
+                    "name, phone, content='members', content_rowid='id', tokenize='trigram')"
+                ))
+            except OperationalError as exc:
+                logger.warning("No FTS5 trigram tokenizer (%s); member search will scan", exc.orig)
+                _unindexed_engines.add(connection.engine)
+                return False
+            connection.execute(text("INSERT INTO members_fts(members_fts) VALUES ('rebuild')"))
+        for statement in SQLITE_SEARCH_DDL:
+            connection.execute(text(statement))
+        return True
+
+    if dialect == "postgresql":
+        for statement in POSTGRES_SEARCH_DDL:
+            connection.execute(text(statement))
+        return True
+
+    logger.warning("No member search index for dialect %s; search will scan", dialect)
+    return False
+
+
+def search_dialect() -> Optional[str]:
+    """
+    Dialect of the current branch's search index, or None when it has
+    none and search must use LIKE
+    """
+    if get_shard().engine in _unindexed_engines:
+        return None
+    return dialect_name()
+
+
+def is_phone_prefix(term: str) -> bool:
+    return bool(PHONE_PATTERN.match(term))
+
+
+def phone_prefix_clause(term: str):
+    """Range predicate equivalent to phone LIKE 'term%' that uses the phone index"""
+    return and_(Member.phone >= term, Member.phone < term + "\uffff")
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def member_search_clause(dialect: Optional[str], term: str):
+    """
+    WHERE clause matching members whose name or phone contains `term`
+    """
+    if len(term) >= MIN_INDEXED_LENGTH and dialect == "sqlite":
+        matches = select(literal_column("rowid")).select_from(text("members_fts")).where(
+            text("members_fts MATCH :fts_query").bindparams(fts_query=_fts_phrase(term))
+        )
+        return Member.id.in_(matches)
+
+    # pg_trgm indexes serve ILIKE directly; short terms fall back to a scan
+    pattern = f"%{term}%"
+    return or_(Member.name.ilike(pattern), Member.phone.ilike(pattern))
+
+
+async def ranked_member_search(db, dialect: Optional[str], term: str, limit: int):
+    """
+    Members matching `term`, best matches first
+    """
+    if len(term) < MIN_INDEXED_LENGTH:
+        query = select(Member).where(member_search_clause(dialect, term)).order_by(Member.name).limit(limit)
+        return (await db.scalars(query)).all()
+
+    if dialect == "sqlite":
+        # Rank inside FTS5, then fetch the rows by primary key and keep that order
+        ranked_ids = (await db.scalars(
+            select(literal_column("rowid"))
+            .select_from(text("members_fts"))
+            .where(text("members_fts MATCH :fts_query").bindparams(fts_query=_fts_phrase(term)))
+            .order_by(literal_column("rank"))
+            .limit(limit)
+        )).all()
+        if not ranked_ids:
+            return []
+        members = {
+            member.id: member
+            for member in (await db.scalars(select(Member).where(Member.id.in_(ranked_ids)))).all()
+        }
+        return [members[member_id] for member_id in ranked_ids if member_id in members]
+
+    if dialect == "postgresql":
+        score = func.greatest(func.similarity(Member.name, term), func.similarity(Member.phone, term))
+        query = select(Member).where(member_search_clause(dialect, term)).order_by(score.desc()).limit(limit)
+        return (await db.scalars(query)).all()
+
+    query = select(Member).where(member_search_clause(dialect, term)).order_by(Member.name).limit(limit)
+    return (await db.scalars(query)).all()
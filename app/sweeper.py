@@ -0,0 +1,134 @@
+"""
+Background expiry of subscriptions past their end date
+
+Marks active subscriptions whose end_date has passed as expired, in batched
+UPDATEs walking the (status, end_date) index, in every branch. Member
+status is left alone: "inactive" is the soft-delete marker, and whether a
+member has a running subscription is read from their subscriptions. Runs
+periodically from the app lifespan, or once from the command line:
+
+    python -m app.sweeper
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime
+
+from sqlalchemy import select, update
+
+from app.cache import subscription_windows
+from app.database import BRANCHES, branch_scoped, open_session, use_branch
+from app.models import Subscription
+
+logger = logging.getLogger(__name__)
+
+
+async def expire_subscriptions(db, today: date, batch_size: int) -> int:
+    """
+    Expire active subscriptions with end_date before `today`. Returns the
+    number of subscriptions expired.
+
+    Every pass checks all of them, including rows written by imports or
+    other workers with end dates already in the past; the index confines
+    the scan to overdue active rows.
+    """
+    expired = 0
+    while True:
+        rows = (await db.execute(
+            select(Subscription.id, Subscription.member_id)
+            .where(Subscription.status == "active", Subscription.end_date < today)
+            .order_by(Subscription.end_date)
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            return expired
+
+        now = datetime.utcnow()
+        member_ids = {member_id for _, member_id in rows}
+
+        await db.execute(
+            update(Subscription)
+            .where(Subscription.id.in_([subscription_id for subscription_id, _ in rows]))
+            .values(status="expired", updated_at=now)
+        )
+        await db.commit()
+
+        for member_id in member_ids:
+            subscription_windows.invalidate(branch_scoped(member_id))
+        expired += len(rows)
+
+
+class SubscriptionSweeper:
+    """Periodically runs expire_subscriptions over every branch"""
+
+    def __init__(self, enabled: bool, interval: float, batch_size: int):
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.runs = 0
+        self.expired = 0
+        self.last_run = None
+        self._task = None
+
+    async def start(self):
+        """Start the periodic task (no-op when disabled)"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the periodic task"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self) -> int:
+        """Expire everything overdue"""
+        today = date.today()
+        expired = 0
+        for branch in BRANCHES:
+            with use_branch(branch):
+                db = open_session()
+                try:
+                    expired += await expire_subscriptions(db, today, self.batch_size)
+                finally:
+                    await db.close()
+
+        self.runs += 1
+        self.expired += expired
+        self.last_run = datetime.utcnow()
+        return expired
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {
+            "enabled": self.enabled,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "expired": self.expired,
+            "last_run": self.last_run,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Subscription expiry sweep failed")
+            await asyncio.sleep(self.interval)
+
+
+subscription_sweeper = SubscriptionSweeper(
+    enabled=os.getenv("SUBSCRIPTION_SWEEP", "1").lower() in ("1", "true", "yes"),
+    interval=float(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL", "3600")),
+    batch_size=int(os.getenv("SUBSCRIPTION_SWEEP_BATCH_SIZE", "1000")),
+)
+
+
+if __name__ == "__main__":
+    count = asyncio.run(subscription_sweeper.run_once())
+    print(f"Expired {count} subscriptions")
@@ -0,0 +1,178 @@
+"""
+Group-commit queue for attendance inserts
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert
+
+from app.database import current_branch, open_session, use_branch
+from app.models import Attendance
+from app.occupancy import close_superseded_sessions, occupancy
+
+
+async def insert_attendance_rows(db, values: list) -> list:
+    """
+    Insert attendance rows with one multi-row INSERT ... RETURNING and
+    return the inserted rows in the order of `values`.
+
+    RETURNING order is not guaranteed for multi-row inserts, and asking
+    SQLAlchemy to sort by parameter order makes SQLite fall back to one
+    INSERT per row, so rows are matched back on (member_id, check_in_time).
+    Rows sharing that key are identical apart from id, so any pairing of
+    them is correct.
+    """
+    result = await db.execute(insert(Attendance).returning(*Attendance.__table__.c), values)
+    returned = {}
+    for row in result.mappings().all():
+        returned.setdefault((row["member_id"], row["check_in_time"]), []).append(dict(row))
+    return [returned[(item["member_id"], item["check_in_time"])].pop() for item in values]
+
+
+class QueueFullError(Exception):
+    """Raised when the queue stays full for longer than the submit timeout"""
+
+
+class AttendanceWriteQueue:
+    """
+    Buffers validated check-ins and inserts them in group commits.
+
+    A background task flushes whenever `max_rows` check-ins are waiting or
+    `flush_interval_ms` has passed since the first one arrived, so a burst
+    of check-ins shares one transaction (and one fsync) instead of taking
+    the write lock once each. Callers await their own row, so a check-in is
+    only acknowledged once it is committed. Each check-in is queued with
+    its branch and a batch commits once per branch it spans.
+    """
+
+    def __init__(self, enabled: bool, maxsize: int, max_rows: int, flush_interval_ms: float, submit_timeout: float):
+        self.enabled = enabled
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.submit_timeout = submit_timeout
+        self.flushed_batches = 0
+        self.flushed_rows = 0
+        self.rejected = 0
+        self._queue = None
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        """Start the flush task (no-op when disabled)"""
+        if self.enabled and self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the flush task"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, member_id: int, check_in_time: datetime, plan_id: Optional[int] = None) -> dict:
+        """Queue a check-in and wait for its committed row"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(
+                self._queue.put((
+                    current_branch.get(),
+                    {"member_id": member_id, "check_in_time": check_in_time, "plan_id": plan_id},
+                    future
+                )),
+                self.submit_timeout
+            )
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise QueueFullError()
+        return await future
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {
+            "enabled": self.enabled,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "flushed_batches": self.flushed_batches,
+            "flushed_rows": self.flushed_rows,
+            "rejected": self.rejected,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_rows:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout > 0:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # Drain anything queued behind the stop marker
+        remaining = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.max_rows):
+            await self._flush(remaining[start:start + self.max_rows])
+
+    async def _flush(self, batch):
+        by_branch = {}
+        for branch, values, future in batch:
+            by_branch.setdefault(branch, []).append((values, future))
+        for branch, items in by_branch.items():
+            with use_branch(branch):
+                await self._flush_branch(items)
+
+    async def _flush_branch(self, batch):
+        db = open_session()
+        try:
+            opened = await close_superseded_sessions(db, [values for values, _ in batch])
+            rows = await insert_attendance_rows(db, [values for values, _ in batch])
+            await db.commit()
+        except Exception as exc:
+            await db.rollback()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            await db.close()
+
+        occupancy.checked_in(opened)
+        self.flushed_batches += 1
+        self.flushed_rows += len(rows)
+        for (_, future), row in zip(batch, rows):
+            if not future.done():
+                future.set_result(row)
+
+
+attendance_queue = AttendanceWriteQueue(
+    enabled=os.getenv("ATTENDANCE_WRITE_BEHIND", "0").lower() in ("1", "true", "yes"),
+    maxsize=int(os.getenv("ATTENDANCE_QUEUE_SIZE", "10000")),
+    max_rows=int(os.getenv("ATTENDANCE_FLUSH_MAX_ROWS", "500")),
+    flush_interval_ms=float(os.getenv("ATTENDANCE_FLUSH_INTERVAL_MS", "20")),
+    submit_timeout=float(os.getenv("ATTENDANCE_QUEUE_TIMEOUT", "1.0")),
+)
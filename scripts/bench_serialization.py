@@ -0,0 +1,119 @@
+"""
+List serialization benchmark
+
+Compares the original list response path (load ORM objects, validate their
+columns through the Pydantic response model, encode with the stdlib json
+module) against the fast path the list endpoints use now
+(select the response columns as tuples, build dicts, encode with orjson)
+for members, plans and attendance.
+
+Usage:
+
+    python scripts/bench_serialization.py [--rows N] [--repeat N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(db_path: str):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["DB_ASYNC"] = "0"
+    sys.path.insert(0, ROOT)
+
+
+def seed(engine, rows: int):
+    from sqlalchemy import insert
+    from app.database import Base
+    from app.models import Attendance, Member, Plan
+
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(Member), [
+            {"name": f"Member {i}", "phone": f"9{i:09d}", "status": "active", "join_date": date.today()}
+            for i in range(1, rows + 1)
+        ])
+        connection.execute(insert(Plan), [
+            {"name": f"Plan {i}", "price": 10 + i % 90, "duration_days": 30, "description": "Monthly"}
+            for i in range(1, rows + 1)
+        ])
+        connection.execute(insert(Attendance), [
+            {"member_id": 1 + i % 10, "check_in_time": now - timedelta(minutes=i), "notes": None}
+            for i in range(rows)
+        ])
+
+
+def timed(fn, repeat: int):
+    """Best wall time of `repeat` runs, plus the last result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    configure(os.path.join(tempfile.mkdtemp(prefix="bench-serialization-"), "bench.db"))
+
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session, raiseload
+    from app.database import engine
+    from app.models import Attendance, Member, Plan
+    from app.schemas import (
+        AttendanceListResponse, AttendanceResponse, MemberListResponse, MemberResponse,
+        PlanListResponse, PlanResponse
+    )
+    from app.serialization import dumps, object_dicts, response_columns, row_dicts
+
+    seed(engine, args.rows)
+
+    cases = [
+        ("members", Member, MemberResponse, MemberListResponse, {}, []),
+        ("plans", Plan, PlanResponse, PlanListResponse, {}, []),
+        ("attendance", Attendance, AttendanceResponse, AttendanceListResponse,
+         {"member": None}, [raiseload(Attendance.member)]),
+    ]
+
+    print(f"{'list':<12}{'rows':>8}{'original ms':>14}{'fast ms':>10}{'speedup':>10}")
+    for name, model, item_schema, list_schema, extra, options in cases:
+        columns = response_columns(model, item_schema)
+
+        def original():
+            with Session(engine) as session:
+                items = session.scalars(select(model).options(*options).order_by(model.id)).all()
+                page = list_schema.model_validate({"total": len(items), "items": object_dicts(items, columns, **extra)})
+                return json.dumps(page.model_dump(mode="json"), separators=(",", ":")).encode()
+
+        def fast():
+            with Session(engine) as session:
+                rows = session.execute(select(*columns).order_by(model.id)).all()
+                page = dict.fromkeys(list_schema.model_fields)
+                page.update(total=len(rows), items=row_dicts(rows, columns, **extra))
+                return dumps(page)
+
+        original_time, original_body = timed(original, args.repeat)
+        fast_time, fast_body = timed(fast, args.repeat)
+        if json.loads(original_body) != json.loads(fast_body):
+            print(f"{name}: fast path output differs from the response model")
+            return 1
+        print(f"{name:<12}{args.rows:>8}{original_time * 1000:>14.1f}{fast_time * 1000:>10.1f}"
+              f"{original_time / fast_time:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
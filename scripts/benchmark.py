@@ -0,0 +1,318 @@
+"""
+Load-test benchmark
+
+Seeds a database at a configurable scale with bulk inserts, then drives
+app.main:app in-process through httpx's ASGI transport with concurrent
+clients, one endpoint at a time. Reports p50/p95/p99 latency and
+throughput per endpoint and writes them, with the commit and settings, to
+a JSON file so runs can be compared across commits.
+
+Usage:
+
+    python scripts/benchmark.py [--members N] [--check-ins N] [--db PATH]
+                                [--requests N] [--concurrency N]
+                                [--endpoints check_in,get_members,...]
+                                [--output results.json] [--compare previous.json]
+
+Seeding a large dataset takes a while; pass --db to keep the seeded SQLite
+file and reuse it on later runs (seeding is skipped when it already holds
+members). Runtime settings (DB_ASYNC, ATTENDANCE_WRITE_BEHIND, ...) are read
+from the environment as usual and recorded in the results.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Rows per INSERT executemany / transaction while seeding
+SEED_CHUNK = 50000
+
+# Environment settings recorded with each run
+RECORDED_SETTINGS = [
+    "DB_ASYNC", "DB_SYNC_MAX_SESSIONS", "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "SQLITE_PROFILE",
+    "DATABASE_READ_URL", "ATTENDANCE_WRITE_BEHIND", "CHECK_IN_DEDUP_SECONDS",
+    "ADMISSION_CONTROL", "ADMISSION_MAX_CONCURRENCY", "ADMISSION_CLIENT_RATE",
+    "ATTENDANCE_FLUSH_MAX_ROWS", "ATTENDANCE_FLUSH_INTERVAL_MS", "SUBSCRIPTION_CACHE_SIZE",
+]
+
+
+def configure(database_url: str):
+    os.environ["DATABASE_URL"] = database_url
+    # Background jobs would skew latencies
+    os.environ["SUBSCRIPTION_SWEEP"] = "0"
+    os.environ["OCCUPANCY_AUTO_CLOSE"] = "0"
+    sys.path.insert(0, ROOT)
+
+
+def _chunks(rows, size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed(engine, members: int, check_ins: int, days: int, rng: random.Random) -> dict:
+    """
+    Bulk-load members (each with an active subscription covering today) and
+    closed attendance history, then derive counters and rollups in bulk.
+    Runs before startup installs the triggers, so inserts stay cheap.
+    """
+    from sqlalchemy import func, insert, select, text
+    from app.counters import reconcile_check_in_counts
+    from app.database import Base
+    from app.models import Attendance, Member, Plan, Subscription
+    from app.rollups import rebuild_rollups
+
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        existing = connection.scalar(select(func.count()).select_from(Member))
+    if existing:
+        print(f"Reusing seeded database ({existing} members)")
+        return {"reused": True, "members": existing}
+
+    started = time.perf_counter()
+    today = date.today()
+    with engine.begin() as connection:
+        connection.execute(insert(Plan), [
+            {"name": f"Plan {days_}", "price": days_, "duration_days": days_} for days_ in (30, 90, 365)
+        ])
+
+    def member_rows():
+        for i in range(1, members + 1):
+            yield {"name": f"Member {i}", "phone": f"9{i:09d}", "status": "active", "join_date": today}
+
+    def subscription_rows():
+        for i in range(1, members + 1):
+            start = today - timedelta(days=i % 300)
+            yield {
+                "member_id": i, "plan_id": 3, "status": "active",
+                "start_date": start, "end_date": start + timedelta(days=365),
+            }
+
+    def attendance_rows():
+        start = datetime.utcnow() - timedelta(days=days)
+        span = days * 86400
+        for _ in range(check_ins):
+            check_in_time = start + timedelta(seconds=rng.randrange(span))
+            yield {
+                "member_id": rng.randint(1, members),
+                "check_in_time": check_in_time,
+                "check_out_time": check_in_time + timedelta(hours=1),
+            }
+
+    for model, rows in ((Member, member_rows()), (Subscription, subscription_rows()), (Attendance, attendance_rows())):
+        for chunk in _chunks(rows, SEED_CHUNK):
+            with engine.begin() as connection:
+                connection.execute(insert(model), chunk)
+        print(f"Seeded {model.__tablename__} ({time.perf_counter() - started:.0f}s)")
+
+    reconcile_check_in_counts(engine)
+    rebuild_rollups(engine)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+    seconds = time.perf_counter() - started
+    print(f"Seeded {members} members and {check_ins} check-ins in {seconds:.0f}s")
+    return {"reused": False, "members": members, "check_ins": check_ins, "seconds": round(seconds, 1)}
+
+
+def endpoints(members: int):
+    """Request factories per endpoint: rng -> (method, url, kwargs)"""
+    from app.pagination import encode_cursor
+
+    def member_id(rng):
+        return rng.randint(1, members)
+
+    return {
+        "check_in": lambda rng: ("POST", "/attendance/check-in", {"json": {"member_id": member_id(rng)}}),
+        "get_members": lambda rng: ("GET", "/members/", {"params": {
+            "limit": 50, "cursor": encode_cursor(member_id(rng))
+        }}),
+        "get_member": lambda rng: ("GET", f"/members/{member_id(rng)}", {}),
+        "search_members": lambda rng: ("GET", "/members/search", {"params": {"q": f"Member {member_id(rng)}"}}),
+        "member_attendance": lambda rng: ("GET", f"/attendance/members/{member_id(rng)}/attendance", {
+            "params": {"limit": 100}
+        }),
+        "current_subscription": lambda rng: (
+            "GET", f"/subscriptions/members/{member_id(rng)}/current-subscription", {}
+        ),
+        "plans": lambda rng: ("GET", "/plans/", {}),
+        "daily_stats": lambda rng: ("GET", "/attendance/stats/daily", {}),
+    }
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_endpoint(client, make_request, requests: int, concurrency: int, warmup: int, rng) -> dict:
+    """Issue `requests` requests from `concurrency` clients and summarize them"""
+    for _ in range(warmup):
+        method, url, kwargs = make_request(rng)
+        await client.request(method, url, **kwargs)
+
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            method, url, kwargs = make_request(rng)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "mean": round(sum(latencies) / len(latencies), 2),
+            "max": round(latencies[-1], 2),
+        },
+    }
+
+
+async def drive(app, selected: list, members: int, args, rng) -> dict:
+    import httpx
+
+    factories = endpoints(members)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            for name in selected:
+                result = await run_endpoint(
+                    client, factories[name], args.requests, args.concurrency, args.warmup, rng
+                )
+                results[name] = result
+                latency = result["latency_ms"]
+                print(f"{name:<22}{result['throughput_rps']:>10.1f}{latency['p50']:>10.2f}"
+                      f"{latency['p95']:>10.2f}{latency['p99']:>10.2f}{result['errors']:>8}")
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(previous_path: str, results: dict):
+    """Print p95 and throughput changes against a previous results file"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nAgainst {previous_path} (commit {previous.get('commit')}):")
+    print(f"{'endpoint':<22}{'p95 ms':>18}{'rps':>20}")
+    for name, result in results.items():
+        before = previous.get("results", {}).get(name)
+        if before is None:
+            continue
+        p95_before, p95_now = before["latency_ms"]["p95"], result["latency_ms"]["p95"]
+        rps_before, rps_now = before["throughput_rps"], result["throughput_rps"]
+        print(f"{name:<22}{p95_before:>8.2f} -> {p95_now:<8.2f}{rps_before:>9.1f} -> {rps_now:<9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=100000)
+    parser.add_argument("--check-ins", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=365, help="Days of attendance history to seed")
+    parser.add_argument("--db", help="SQLite file to seed or reuse (default: a throwaway file)")
+    parser.add_argument("--database-url", help="Benchmark against this database instead of SQLite")
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests per endpoint")
+    parser.add_argument("--endpoints", help="Comma-separated subset of endpoints to run")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for data and request mix")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    if args.database_url:
+        database_url = args.database_url
+    else:
+        path = args.db or os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "benchmark.db")
+        database_url = f"sqlite:///{os.path.abspath(path)}"
+    configure(database_url)
+
+    import sqlalchemy
+    from app.database import engine, USE_ASYNC_DB
+    from app.main import app
+
+    names = list(endpoints(0))
+    selected = args.endpoints.split(",") if args.endpoints else names
+    unknown = set(selected) - set(names)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))} (choose from {', '.join(names)})")
+
+    rng = random.Random(args.seed)
+    seeded = seed(engine, args.members, args.check_ins, args.days, rng)
+    members = seeded["members"]
+
+    print(f"\n{'endpoint':<22}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    results = asyncio.run(drive(app, selected, members, args, rng))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "environment": {
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "platform": platform.platform(),
+            "dialect": engine.dialect.name,
+            "async_db": USE_ASYNC_DB,
+            "settings": {name: os.environ[name] for name in RECORDED_SETTINGS if name in os.environ},
+        },
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "dataset": seeded,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        compare(args.compare, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Shared fixtures: the app in-process over one seeded SQLite database
+
+The app reads its configuration when first imported, so the environment is
+set here before anything imports `app`. TEST_SEED_MEMBERS and
+TEST_SEED_CHECK_INS size the seeded data; DB_ASYNC picks the session path
+(blocking sessions unless set). Tests needing other import-time settings
+re-run pytest in a fresh interpreter through `run_pytest`.
+"""
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="membership-tests-")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ.setdefault("DB_ASYNC", "0")
+os.environ["SUBSCRIPTION_SWEEP"] = "0"
+os.environ["OCCUPANCY_AUTO_CLOSE"] = "0"
+# Repeat check-ins measure the cached path, not the scan window
+os.environ["CHECK_IN_DEDUP_SECONDS"] = "0"
+os.environ["ADMISSION_CONTROL"] = "0"
+sys.path.insert(0, ROOT)
+
+SEED_MEMBERS = int(os.getenv("TEST_SEED_MEMBERS", "5000"))
+SEED_CHECK_INS = int(os.getenv("TEST_SEED_CHECK_INS", "50000"))
+
+
+def seed(engine, members: int, check_ins: int):
+    from sqlalchemy import insert, text
+    from app.models import Attendance, Member, Plan, Subscription
+
+    today = date.today()
+    random.seed(7)
+    with engine.begin() as connection:
+        connection.execute(insert(Plan), [
+            {"name": f"Plan {days}", "price": days, "duration_days": days} for days in (30, 90, 365)
+        ])
+        connection.execute(insert(Member), [
+            {"name": f"Member {i}", "phone": f"9{i:09d}", "status": "active", "join_date": today}
+            for i in range(1, members + 1)
+        ])
+        connection.execute(insert(Subscription), [
+            {
+                "member_id": i,
+                "plan_id": 1 + i % 3,
+                "start_date": today - timedelta(days=i % 60),
+                "end_date": today - timedelta(days=i % 60) + timedelta(days=30),
+                "status": "active",
+            }
+            for i in range(1, members + 1)
+        ])
+        start = datetime.utcnow() - timedelta(days=365)
+        visits = []
+        for _ in range(check_ins):
+            check_in_time = start + timedelta(seconds=random.randint(0, 365 * 86400))
+            visits.append({
+                "member_id": random.randint(1, members),
+                "check_in_time": check_in_time,
+                "check_out_time": check_in_time + timedelta(hours=1),
+            })
+        # A few members still on the floor
+        visits[-20:] = [dict(visit, check_out_time=None) for visit in visits[-20:]]
+        connection.execute(insert(Attendance), visits)
+        connection.execute(text("ANALYZE"))
+
+
+class StatementRecorder:
+    """Collects (statement, parameters, executemany) of every statement run while recording"""
+
+    def __init__(self):
+        self.statements = None
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.statements is not None:
+            self.statements.append((statement, parameters, executemany))
+
+    @contextmanager
+    def recording(self):
+        self.statements = []
+        try:
+            yield self.statements
+        finally:
+            self.statements = None
+
+
+@pytest.fixture(scope="session")
+def engine():
+    from app.database import engine
+    return engine
+
+
+@pytest.fixture(scope="session")
+def client(engine):
+    from fastapi.testclient import TestClient
+    from app.archive import archive_attendance
+    from app.main import app
+
+    with TestClient(app) as client:
+        seed(engine, SEED_MEMBERS, SEED_CHECK_INS)
+        # Older months live in archive tables, as in production
+        archive_attendance(engine)
+        yield client
+
+
+@pytest.fixture(scope="session")
+def recorder(client):
+    from sqlalchemy import event
+    from app.database import sync_engines
+
+    recorder = StatementRecorder()
+    # GET handlers read through their own engine
+    for hooked in sync_engines():
+        event.listen(hooked, "before_cursor_execute", recorder)
+    yield recorder
+    for hooked in sync_engines():
+        event.remove(hooked, "before_cursor_execute", recorder)
+
+
+
+def run_pytest(env: dict, *paths: str) -> subprocess.CompletedProcess:
+    """Run pytest on `paths` in a fresh interpreter with `env` added to the environment"""
+    return subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", *paths],
+        cwd=ROOT,
+        env=dict(os.environ, **env),
+        capture_output=True,
+        text=True,
+    )
@@ -0,0 +1,74 @@
+"""
+Admission control
+
+Drives AdmissionMiddleware directly over a stub ASGI app, with its own
+controller, since conftest disables admission control for the app.
+"""
+import asyncio
+
+from app.admission import AdmissionController, AdmissionMiddleware
+
+
+def _controller(**overrides) -> AdmissionController:
+    settings = dict(
+        max_concurrency=4, check_in_reserved=2, low_share=0.25,
+        queue_timeouts={"critical": 1.0, "normal": 0, "low": 0}, client_rate=0, client_burst=0,
+    )
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+async def _request(middleware, method: str, path: str) -> tuple:
+    """(status, headers) of one request through `middleware`"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": [], "client": ("10.0.0.1", 5000)}
+    await middleware(scope, receive, send)
+    start = messages[0]
+    return start["status"], dict(start["headers"])
+
+
+async def _ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_low_class_at_ceiling_is_shed():
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await _ok(scope, receive, send)
+
+    async def scenario():
+        middleware = AdmissionMiddleware(app, _controller(), retry_after=3)
+        held = asyncio.create_task(_request(middleware, "GET", "/members/"))
+        await asyncio.sleep(0)
+        shed = await _request(middleware, "GET", "/exports/attendance")
+        # Check-ins still get in while the low class is full
+        scan = asyncio.create_task(_request(middleware, "POST", "/attendance/check-in"))
+        await asyncio.sleep(0)
+        release.set()
+        return shed, await held, await scan, middleware.controller
+
+    (status, headers), held, scan, controller = asyncio.run(scenario())
+    assert status == 503
+    assert headers[b"retry-after"] == b"3"
+    assert held[0] == 200 and scan[0] == 200
+    assert controller.shed["low"] == 1
+
+
+def test_empty_token_bucket_is_429():
+    async def scenario():
+        middleware = AdmissionMiddleware(_ok, _controller(client_rate=0.5, client_burst=2))
+        return [await _request(middleware, "GET", "/members/1") for _ in range(3)]
+
+    responses = asyncio.run(scenario())
+    assert [status for status, _ in responses] == [200, 200, 429]
+    assert int(responses[2][1][b"retry-after"]) >= 1
@@ -0,0 +1,18 @@
+"""
+Async session path
+
+conftest runs the app on blocking sessions, and the app picks its session
+path when first imported, so the whole suite is run again in a fresh
+interpreter with DB_ASYNC=1 to drive the same endpoints through AsyncSession.
+"""
+import os
+
+import pytest
+
+from conftest import run_pytest
+
+
+@pytest.mark.skipif(os.environ["DB_ASYNC"] == "1", reason="already running on async sessions")
+def test_suite_passes_on_async_sessions():
+    result = run_pytest({"DB_ASYNC": "1"}, "tests")
+    assert result.returncode == 0, result.stdout[-4000:] + result.stderr[-2000:]
@@ -0,0 +1,74 @@
+"""
+Branch routing
+
+BRANCH_SHARDS is read when the app is first imported, so
+test_branch_suite re-runs this module in a fresh interpreter with a second
+branch ("north", its own SQLite file); the other tests only run there.
+"""
+import json
+import os
+
+import pytest
+from sqlalchemy import func, select
+
+from conftest import run_pytest
+
+SHARDED = bool(os.getenv("BRANCH_SHARDS"))
+sharded_only = pytest.mark.skipif(not SHARDED, reason="needs BRANCH_SHARDS (run by test_branch_suite)")
+
+NORTH = {"X-Branch-Id": "north"}
+
+
+def _members_with_phone(branch: str, phone: str) -> int:
+    from app.database import get_shard
+    from app.models import Member
+
+    with get_shard(branch).engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(Member).where(Member.phone == phone))
+
+
+@pytest.mark.skipif(SHARDED, reason="already running with branches")
+def test_branch_suite(tmp_path):
+    shards = {"north": f"sqlite:///{tmp_path / 'north.db'}"}
+    result = run_pytest(
+        {"BRANCH_SHARDS": json.dumps(shards), "TEST_SEED_MEMBERS": "100", "TEST_SEED_CHECK_INS": "1000"},
+        "tests/test_branches.py",
+    )
+    assert result.returncode == 0, result.stdout[-4000:] + result.stderr[-2000:]
+    assert "3 passed" in result.stdout
+
+
+@sharded_only
+def test_branch_header_routes_to_its_shard(client):
+    response = client.post("/members/", json={"name": "North Member", "phone": "8100000001"}, headers=NORTH)
+    assert response.status_code == 201
+    member_id = response.json()["id"]
+
+    assert _members_with_phone("north", "8100000001") == 1
+    assert _members_with_phone("main", "8100000001") == 0
+    assert client.get(f"/members/{member_id}", headers=NORTH).json()["phone"] == "8100000001"
+    assert client.get("/members/by-phone/8100000001").json()["branch"] == "north"
+
+
+@sharded_only
+def test_unknown_branch_is_404(client):
+    response = client.get("/members/", headers={"X-Branch-Id": "nowhere"})
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Unknown branch"}
+
+
+@sharded_only
+def test_directory_conflict_rolls_back_member(client, monkeypatch):
+    import app.routers.members
+    from app.directory import register_members
+
+    client.portal.call(register_members, [("8100000002", 1)], "main")
+
+    async def not_registered_yet(phone):
+        # Lost the race: another branch registers the phone after our check
+        return None
+
+    monkeypatch.setattr(app.routers.members, "lookup_phone", not_registered_yet)
+    response = client.post("/members/", json={"name": "Late Member", "phone": "8100000002"}, headers=NORTH)
+    assert response.status_code == 400
+    assert _members_with_phone("north", "8100000002") == 0
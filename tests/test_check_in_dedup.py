@@ -0,0 +1,36 @@
+"""
+Repeated check-in scans
+
+conftest turns the de-duplication window off (CHECK_IN_DEDUP_SECONDS=0) so
+other tests measure real check-ins; these swap in a deduplicator with a
+window.
+"""
+import pytest
+
+
+@pytest.fixture
+def dedup(client, monkeypatch):
+    import app.routers.attendance
+    from app.dedup import ScanDeduplicator
+
+    deduplicator = ScanDeduplicator(window=30, key_ttl=60, maxsize=1000)
+    monkeypatch.setattr(app.routers.attendance, "scan_deduplicator", deduplicator)
+    return deduplicator
+
+
+def test_repeat_scan_returns_first_check_in(client, dedup):
+    first = client.post("/attendance/check-in", json={"member_id": 21})
+    assert first.status_code == 201
+
+    repeat = client.post("/attendance/check-in", json={"member_id": 21})
+    assert repeat.status_code == 200
+    assert repeat.json()["id"] == first.json()["id"]
+    assert dedup.duplicates == 1
+
+
+def test_idempotency_key_reused_for_another_member(client, dedup):
+    headers = {"Idempotency-Key": "turnstile-7-0001"}
+    assert client.post("/attendance/check-in", json={"member_id": 22}, headers=headers).status_code == 201
+
+    response = client.post("/attendance/check-in", json={"member_id": 23}, headers=headers)
+    assert response.status_code == 422
@@ -0,0 +1,93 @@
+"""
+SQL statements per request
+
+Each case sends one request against the seeded database and fails if it
+issues more statements than its budget. List endpoints must stay flat
+however many rows a page holds, so a per-row lazy load (N+1) fails here.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+
+def _next_cursor(client, url: str, params: dict) -> str:
+    return client.get(url, params=params).json()["next_cursor"]
+
+
+def _since():
+    return (datetime.utcnow() - timedelta(days=1)).isoformat()
+
+
+# (id, client -> (method, url, request kwargs), budget), run in order; anything
+# a case needs first (e.g. a cursor) is fetched before counting starts
+BUDGETS = [
+    ("members-page", lambda c: ("GET", "/members/", {"params": {"limit": 50}}), 1),
+    ("members-next-page", lambda c: ("GET", "/members/", {"params": {
+        "limit": 50, "cursor": _next_cursor(c, "/members/", {"limit": 50})
+    }}), 1),
+    ("members-status", lambda c: ("GET", "/members/", {"params": {"limit": 50, "status": "active"}}), 1),
+    ("members-filter", lambda c: ("GET", "/members/", {"params": {"limit": 20, "search": "ber 12"}}), 1),
+    ("members-search", lambda c: ("GET", "/members/search", {"params": {"q": "900000"}}), 2),
+    ("member", lambda c: ("GET", "/members/7", {}), 1),
+    ("plans", lambda c: ("GET", "/plans/", {}), 1),
+    ("plan-cached", lambda c: ("GET", "/plans/1", {}), 0),
+    ("subscriptions", lambda c: ("GET", "/subscriptions/", {"params": {"limit": 200}}), 1),
+    ("subscriptions-active", lambda c: ("GET", "/subscriptions/", {"params": {"limit": 200, "status": "active"}}), 1),
+    ("subscriptions-expand", lambda c: ("GET", "/subscriptions/", {"params": {
+        "limit": 200, "expand": "member,plan"
+    }}), 3),
+    ("current-subscription", lambda c: ("GET", "/subscriptions/members/5/current-subscription", {}), 2),
+    ("current-subscription-expand", lambda c: ("GET", "/subscriptions/members/5/current-subscription", {
+        "params": {"expand": "member,plan"}
+    }), 4),
+    # Subscription windows, the member's open sessions, closing them and the
+    # INSERT; the cached repeat skips the windows
+    ("check-in", lambda c: ("POST", "/attendance/check-in", {"json": {"member_id": 11}}), 4),
+    ("check-in-cached", lambda c: ("POST", "/attendance/check-in", {"json": {"member_id": 11}}), 3),
+    ("check-out", lambda c: ("POST", "/attendance/check-out", {"json": {"member_id": 11}}), 1),
+    ("occupancy", lambda c: ("GET", "/attendance/occupancy", {}), 0),
+    # Two validation queries, the members' open sessions, one executemany
+    # closing them and one multi-row INSERT ... RETURNING
+    ("bulk-check-in", lambda c: ("POST", "/attendance/check-in/bulk", {"json": {
+        "items": [{"member_id": i} for i in range(1, 50)]
+    }}), 5),
+    # History reaching archived months costs the catalog lookup and one
+    # query over the archived months (plus one count)
+    ("history", lambda c: ("GET", "/attendance/members/3/attendance", {"params": {"limit": 5}}), 4),
+    ("history-next-page", lambda c: ("GET", "/attendance/members/3/attendance", {"params": {
+        "limit": 5, "cursor": _next_cursor(c, "/attendance/members/3/attendance", {"limit": 5})
+    }}), 4),
+    ("history-total", lambda c: ("GET", "/attendance/members/3/attendance", {"params": {
+        "limit": 100, "include_total": True
+    }}), 6),
+    ("history-expand", lambda c: ("GET", "/attendance/members/3/attendance", {"params": {
+        "limit": 100, "expand": "member"
+    }}), 4),
+    ("history-recent", lambda c: ("GET", "/attendance/members/3/attendance", {"params": {
+        "from": (datetime.utcnow() - timedelta(days=30)).isoformat(), "to": datetime.utcnow().isoformat()
+    }}), 2),
+    ("stats-hourly", lambda c: ("GET", "/attendance/stats/hourly", {}), 1),
+    ("stats-daily", lambda c: ("GET", "/attendance/stats/daily", {"params": {
+        "from": str(date.today() - timedelta(days=365))
+    }}), 1),
+    ("stats-member-monthly", lambda c: ("GET", "/attendance/stats/members/3/monthly", {}), 2),
+    ("stats-plans-hourly", lambda c: ("GET", "/attendance/stats/plans/hourly", {}), 1),
+    ("stats-plans-daily", lambda c: ("GET", "/attendance/stats/plans/daily", {"params": {"plan_id": 2}}), 1),
+    # One rollup query per branch shard
+    ("stats-branches-daily", lambda c: ("GET", "/attendance/stats/branches/daily", {}), 1),
+    ("export-attendance-delta", lambda c: ("GET", "/exports/attendance", {"params": {"since": _since()}}), 3),
+    ("export-subscriptions-delta", lambda c: ("GET", "/exports/subscriptions", {"params": {
+        "since": _since(), "format": "ndjson"
+    }}), 1),
+]
+
+
+@pytest.mark.parametrize(
+    "case, budget", [(case, budget) for _, case, budget in BUDGETS], ids=[name for name, _, _ in BUDGETS]
+)
+def test_request_within_statement_budget(client, recorder, case, budget):
+    method, url, kwargs = case(client)
+    with recorder.recording() as statements:
+        response = client.request(method, url, **kwargs)
+    assert response.status_code < 400, response.text
+    assert len(statements) <= budget, "\n".join(" ".join(statement.split()) for statement, _, _ in statements)